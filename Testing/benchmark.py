@@ -0,0 +1,215 @@
+"""Benchmarks for the VSEQF timeline algorithms, run on plain CPython without Blender.
+
+The addon modules are imported with the stand-in bpy from fake_bpy.py, then synthetic timelines of various sizes are
+generated and the timeline, grab, cut, shortcut and marker functions are timed on them.  Results are written to a json
+file so they can be compared between releases.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --sizes 1000 10000 --queries 200 --output results.json"""
+
+import os
+import sys
+import json
+import time
+import types
+import random
+import argparse
+import platform
+import importlib
+
+testing_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, testing_path)
+import fake_bpy
+
+package_name = 'vseqf_benchmark'
+
+
+def load_addon():
+    """Imports the addon modules under a stand-in package, without running the addon __init__
+    Returns: Dictionary of module name: module"""
+
+    fake_bpy.install()
+    package = types.ModuleType(package_name)
+    package.__path__ = [os.path.dirname(testing_path)]
+    sys.modules[package_name] = package
+    modules = {}
+    for name in ['vseqf', 'timeline', 'markers', 'fades', 'grabs', 'cuts', 'shortcuts']:
+        modules[name] = importlib.import_module(package_name+'.'+name)
+    return modules
+
+
+def make_timeline(strip_count, channels=64, marker_count=None, effect_ratio=0.02, sound_ratio=0.2, seed=0):
+    """Creates a FakeScene with a synthetic timeline and makes it the current scene
+    Arguments:
+        strip_count: Integer, number of strips to create
+        channels: Integer, number of channels to spread the strips across
+        marker_count: Integer, number of markers to add, defaults to one per ten strips
+        effect_ratio: Float, number of effect strips to add, as a fraction of strip_count
+        sound_ratio: Float, fraction of strips that are sound strips
+        seed: Integer, random seed so the same timeline is generated every time
+
+    Returns: FakeScene"""
+
+    generator = random.Random(seed)
+    scene = fake_bpy.FakeScene()
+    strips = scene.sequence_editor.strips
+    channel_ends = [1] * (channels + 1)
+    for strip_number in range(strip_count):
+        channel = generator.randint(1, channels)
+        left = channel_ends[channel] + generator.randint(0, 40)
+        right = left + generator.randint(1, 200)
+        if generator.random() < sound_ratio:
+            strip_type = 'SOUND'
+        else:
+            strip_type = 'MOVIE'
+        strips.append(fake_bpy.FakeStrip('Strip '+str(strip_number), channel, left, right, strip_type))
+        channel_ends[channel] = right
+    base_strips = list(strips)
+    for effect_number in range(int(strip_count * effect_ratio)):
+        first = generator.choice(base_strips)
+        channel = min(first.channel + 1, 128)
+        strips.append(fake_bpy.FakeEffectStrip('Effect '+str(effect_number), channel, first.left_handle, first.right_handle, input_1=first))
+    if marker_count is None:
+        marker_count = strip_count // 10
+    end = max(channel_ends)
+    for marker_number in range(marker_count):
+        scene.timeline_markers.new('Marker '+str(marker_number), frame=generator.randint(1, end))
+    fake_bpy.set_scene(scene)
+    return scene
+
+
+class Benchmark(object):
+    """Collects timings for one timeline size"""
+
+    def __init__(self, modules, strip_count, queries, seed=0):
+        self.modules = modules
+        self.strip_count = strip_count
+        self.queries = queries
+        self.seed = seed
+        self.results = {}
+
+    def record(self, name, calls, function, *args):
+        """Times a function and stores the result
+        Arguments:
+            name: String, name to store the result under
+            calls: Integer, number of calls the function makes, used to find the time per call
+            function: Function to time
+            *args: Arguments given to the function
+
+        Returns: The value returned by the function"""
+
+        start = time.perf_counter()
+        value = function(*args)
+        total = time.perf_counter() - start
+        self.results[name] = {'calls': calls, 'total': total, 'per_call': total / max(calls, 1)}
+        return value
+
+    def fresh_timeline(self):
+        scene = make_timeline(self.strip_count, seed=self.seed)
+        self.modules['timeline'].strip_geometry_tag_invalid()
+        return scene
+
+    def run(self):
+        timeline = self.modules['timeline']
+        grabs = self.modules['grabs']
+        shortcuts = self.modules['shortcuts']
+        cuts = self.modules['cuts']
+        generator = random.Random(self.seed)
+
+        scene = self.record('make_timeline', 1, self.fresh_timeline)
+        strips = list(scene.sequence_editor.strips)
+        end = timeline.find_strips_end(strips)
+        linear_queries = max(1, min(self.queries, 2000000 // max(len(strips), 1)))
+
+        self.record('strip_geometry_build', 1, timeline.get_strip_geometry)
+
+        areas = []
+        for query in range(self.queries):
+            left = generator.randint(1, end)
+            channel = generator.randint(1, 64)
+            areas.append([left, left + generator.randint(1, 300), channel])
+
+        def area_filled(areas, strips=False):
+            for left, right, channel in areas:
+                timeline.sequencer_area_filled(left, right, channel, channel, [], strips=strips)
+        self.record('sequencer_area_filled', len(areas), area_filled, areas)
+        self.record('sequencer_area_filled_linear', linear_queries, area_filled, areas[:linear_queries], strips)
+
+        close_queries = []
+        modes = ['overlap', 'channel', 'simple', 'nooverlap', 'all']
+        for query in range(self.queries):
+            close_queries.append([generator.choice(strips), generator.choice(['next', 'previous']), generator.choice(modes)])
+
+        def find_close(close_queries, strips=None):
+            for strip, direction, mode in close_queries:
+                timeline.find_close_strip(strips, strip, direction, mode=mode, sounds=True)
+        self.record('find_close_strip_build', 1, find_close, close_queries[:1])
+        self.record('find_close_strip', len(close_queries), find_close, close_queries)
+        self.record('find_close_strip_linear', linear_queries, find_close, close_queries[:linear_queries], strips)
+
+        frames = [generator.randint(1, end) for query in range(self.queries)]
+
+        def edges(frames, channel=None):
+            for frame in frames:
+                shortcuts.find_edge(frame, 'next', channel=channel)
+                shortcuts.find_edge(frame, 'previous', channel=channel)
+        self.record('find_edge_build', 1, edges, frames[:1])
+        self.record('find_edge', len(frames) * 2, edges, frames)
+        self.record('find_edge_channel', len(frames) * 2, edges, frames, 1)
+
+        def near_markers(frames):
+            for frame in frames:
+                grabs.near_marker(fake_bpy.context, frame)
+        self.record('near_marker', len(frames), near_markers, frames)
+
+        def ripple(frames, amount):
+            moved = 0
+            for frame in frames:
+                moved = moved + grabs.ripple_timeline(scene.sequence_editor, None, frame, amount, select_ripple=False, move_markers=True)
+                moved = moved + grabs.ripple_timeline(scene.sequence_editor, None, frame + amount, -amount, select_ripple=False, move_markers=True)
+            return moved
+        ripple_frames = frames[:5]
+        self.record('ripple_timeline', len(ripple_frames) * 2, ripple, ripple_frames, 50)
+
+        scene = self.fresh_timeline()
+        deletable = [strip for strip in scene.sequence_editor.strips if not hasattr(strip, 'input_1')]
+        for strip in generator.sample(deletable, max(1, len(deletable) // 100)):
+            strip.select = True
+        timeline.get_strip_geometry()
+        operator = cuts.VSEQFDelete()
+        operator.ripple = True
+        self.record('delete_ripple', 1, operator.execute, fake_bpy.context)
+        return self.results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the VSEQF timeline algorithms')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Numbers of strips to test with')
+    parser.add_argument('--queries', type=int, default=1000, help='Number of queries to time for each function')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for generating timelines and queries')
+    parser.add_argument('--output', default='benchmark_results.json', help='File to write the results to')
+    arguments = parser.parse_args()
+
+    modules = load_addon()
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'queries': arguments.queries,
+        'seed': arguments.seed,
+        'sizes': {}
+    }
+    for size in arguments.sizes:
+        print('Timing '+str(size)+' strips...')
+        size_results = Benchmark(modules, size, arguments.queries, seed=arguments.seed).run()
+        results['sizes'][str(size)] = size_results
+        for name, result in size_results.items():
+            print('    {:<32}{:>10} calls {:>12.6f}s per call'.format(name, result['calls'], result['per_call']))
+    with open(arguments.output, 'w') as output_file:
+        json.dump(results, output_file, indent=4)
+    print('Results written to '+arguments.output)
+
+
+if __name__ == '__main__':
+    main()
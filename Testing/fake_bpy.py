@@ -0,0 +1,318 @@
+"""Lightweight stand-in for the parts of bpy that the VSEQF timeline algorithms touch.
+
+This is not an emulation of Blender, it only provides enough of the strip, marker and scene data model to run the
+timeline, grab, cut and shortcut functions on plain CPython so their cost can be measured."""
+
+import sys
+import types
+import importlib.util
+
+
+class FakeChannel(object):
+    """Stand-in for bpy.types.SequenceTimelineChannel"""
+
+    def __init__(self):
+        self.lock = False
+        self.mute = False
+
+
+class FakeStrip(object):
+    """Stand-in for bpy.types.Strip, content_start moves both handles like in Blender"""
+
+    def __init__(self, name, channel, left_handle, right_handle, strip_type='MOVIE'):
+        self.name = name
+        self.type = strip_type
+        self.channel = channel
+        self._content_start = left_handle
+        self._left = left_handle
+        self._right = right_handle
+        self.lock = False
+        self.mute = False
+        self.select = False
+        self.select_left_handle = False
+        self.select_right_handle = False
+        self.volume = 1.0
+        self.blend_alpha = 1.0
+        self.left_handle_offset = 0
+        self.right_handle_offset = 0
+        self.content_duration = right_handle - left_handle
+        self.tags = []
+
+    def as_pointer(self):
+        return id(self)
+
+    @property
+    def content_start(self):
+        return self._content_start
+
+    @content_start.setter
+    def content_start(self, value):
+        value = int(value)
+        delta = value - self._content_start
+        self._content_start = value
+        self._left = self._left + delta
+        self._right = self._right + delta
+
+    @property
+    def left_handle(self):
+        return self._left
+
+    @left_handle.setter
+    def left_handle(self, value):
+        self._left = int(value)
+
+    @property
+    def right_handle(self):
+        return self._right
+
+    @right_handle.setter
+    def right_handle(self, value):
+        self._right = int(value)
+
+    @property
+    def duration(self):
+        return self._right - self._left
+
+    def __repr__(self):
+        return '<FakeStrip '+self.name+' ch'+str(self.channel)+' '+str(self._left)+'-'+str(self._right)+'>'
+
+
+class FakeEffectStrip(FakeStrip):
+    """Stand-in for an effect strip, unlike in Blender it does not follow its inputs when they are moved"""
+
+    def __init__(self, name, channel, left_handle, right_handle, input_1=None, input_2=None, strip_type='CROSS'):
+        FakeStrip.__init__(self, name, channel, left_handle, right_handle, strip_type=strip_type)
+        self.input_1 = input_1
+        self.input_2 = input_2
+
+
+class FakeCollection(list):
+    """List with the bpy_prop_collection methods used by the addon"""
+
+    def foreach_get(self, attribute, sequence):
+        for index, item in enumerate(self):
+            sequence[index] = getattr(item, attribute)
+
+    def foreach_set(self, attribute, sequence):
+        for index, item in enumerate(self):
+            setattr(item, attribute, sequence[index])
+
+    def new_effect(self, name, type, channel, frame_start, length=1, input1=None, input2=None):
+        strip = FakeEffectStrip(name, channel, frame_start, frame_start + length, input_1=input1, input_2=input2, strip_type=type)
+        self.append(strip)
+        return strip
+
+
+class FakeMarker(object):
+    """Stand-in for bpy.types.TimelineMarker"""
+
+    def __init__(self, name, frame):
+        self.name = name
+        self.frame = frame
+        self.select = False
+
+    def as_pointer(self):
+        return id(self)
+
+
+class FakeMarkers(FakeCollection):
+    """Stand-in for bpy.types.TimelineMarkers"""
+
+    def new(self, name, frame=0):
+        marker = FakeMarker(name, frame)
+        self.append(marker)
+        return marker
+
+
+class FakeSequenceEditor(object):
+    """Stand-in for bpy.types.SequenceEditor, meta strips are not supported"""
+
+    def __init__(self):
+        self.strips = FakeCollection()
+        self.meta_stack = FakeCollection()
+        self.channels = [FakeChannel() for _ in range(129)]
+        self.active_strip = None
+        self.overlay_frame = 0
+        self.selected_retiming_keys = False
+
+    @property
+    def strips_all(self):
+        return self.strips
+
+
+class FakeSettings(object):
+    """Stand-in for the scene.vseqf property group, all defaults match VSEQFSetting"""
+    ripple_markers = False
+    quickcuts_insert = 0
+    quickcuts_all = False
+    transition = 'CROSS'
+    fade = 10
+    vu_show = True
+    vu = -60
+    vu_max = -60
+
+
+class FakeRender(object):
+    """Stand-in for bpy.types.RenderSettings"""
+    fps = 30
+    fps_base = 1.0
+
+
+class FakeScene(object):
+    """Stand-in for bpy.types.Scene"""
+
+    def __init__(self, name='Scene'):
+        self.name = name
+        self.sequence_editor = FakeSequenceEditor()
+        self.timeline_markers = FakeMarkers()
+        self.frame_current = 1
+        self.frame_start = 1
+        self.frame_end = 250
+        self.render = FakeRender()
+        self.vseqf = FakeSettings()
+        self.animation_data = None
+
+    def as_pointer(self):
+        return id(self)
+
+
+class FakeContext(object):
+    """Stand-in for bpy.context, only the members used by the timeline functions are provided"""
+
+    def __init__(self, scene):
+        self.scene = scene
+        self.region = None
+        self.screen = None
+
+    @property
+    def strips(self):
+        sequence_editor = self.scene.sequence_editor
+        if len(sequence_editor.meta_stack) > 0:
+            return list(sequence_editor.meta_stack[-1].strips)
+        return list(sequence_editor.strips)
+
+    @property
+    def selected_strips(self):
+        return [strip for strip in self.strips if strip.select]
+
+
+class FakeOperatorCall(object):
+    """Callable stand-in for bpy.ops.<module>.<operator>, runs a registered python function if there is one"""
+
+    def __init__(self, module, name):
+        self.module = module
+        self.name = name
+
+    def __call__(self, *args, **kwargs):
+        function = operator_functions.get(self.module+'.'+self.name)
+        if function is not None:
+            return function(*args, **kwargs)
+        return {'FINISHED'}
+
+
+class FakeOperatorModule(object):
+    """Stand-in for a bpy.ops submodule such as bpy.ops.sequencer"""
+
+    def __init__(self, module):
+        self.module = module
+
+    def __getattr__(self, name):
+        return FakeOperatorCall(self.module, name)
+
+
+class FakeOps(object):
+    """Stand-in for bpy.ops"""
+
+    def __getattr__(self, module):
+        return FakeOperatorModule(module)
+
+
+class FakeType(object):
+    """Base class used for every bpy.types member, enough for the addon classes to be defined"""
+
+    @classmethod
+    def draw_handler_add(cls, *args):
+        return None
+
+    @classmethod
+    def draw_handler_remove(cls, *args):
+        return None
+
+    def report(self, *args):
+        pass
+
+
+def fake_property(*args, **kwargs):
+    #Properties are only used as class annotations, operators have their values set directly on the instance
+    return None
+
+
+def persistent(function):
+    #Stand-in for bpy.app.handlers.persistent
+    return function
+
+
+def sequencer_delete(*args, **kwargs):
+    """Stand-in for bpy.ops.sequencer.delete, removes the selected strips of the current scene"""
+    strips = context.scene.sequence_editor.strips
+    strips[:] = [strip for strip in strips if not strip.select]
+    return {'FINISHED'}
+
+
+operator_functions = {
+    'sequencer.delete': sequencer_delete,
+}
+context = FakeContext(FakeScene())
+
+
+def make_module(name, **attributes):
+    #Creates an empty module with the given attributes
+    module = types.ModuleType(name)
+    for key, value in attributes.items():
+        setattr(module, key, value)
+    return module
+
+
+def types_getattr(name):
+    #Any bpy.types member that is asked for is created as a subclass of FakeType
+    fake_class = type(name, (FakeType, ), {})
+    setattr(bpy_types, name, fake_class)
+    return fake_class
+
+
+bpy_types = make_module('bpy.types')
+bpy_types.__getattr__ = types_getattr
+bpy_props = make_module('bpy.props', **{name: fake_property for name in ['BoolProperty', 'IntProperty', 'FloatProperty', 'StringProperty', 'EnumProperty', 'PointerProperty', 'CollectionProperty', 'FloatVectorProperty', 'IntVectorProperty']})
+bpy_app_handlers = make_module('bpy.app.handlers', persistent=persistent, depsgraph_update_post=[], load_post=[], undo_post=[], redo_post=[], frame_change_post=[])
+bpy_app = make_module('bpy.app', handlers=bpy_app_handlers, version=(5, 1, 0))
+bpy_msgbus = make_module('bpy.msgbus', subscribe_rna=fake_property, clear_by_owner=fake_property)
+bpy = make_module('bpy', types=bpy_types, props=bpy_props, app=bpy_app, ops=FakeOps(), msgbus=bpy_msgbus, context=context, data=None)
+
+
+def set_scene(scene):
+    """Makes the given FakeScene the one returned by bpy.context.scene"""
+    context.scene = scene
+    return context
+
+
+def install():
+    """Registers the fake modules in sys.modules so the addon modules can be imported"""
+    modules = {
+        'bpy': bpy,
+        'bpy.types': bpy_types,
+        'bpy.props': bpy_props,
+        'bpy.app': bpy_app,
+        'bpy.app.handlers': bpy_app_handlers,
+        'bpy.msgbus': bpy_msgbus,
+        'gpu': make_module('gpu'),
+        'mathutils': make_module('mathutils', Matrix=tuple),
+        'blf': make_module('blf'),
+        'gpu_extras': make_module('gpu_extras'),
+        'gpu_extras.batch': make_module('gpu_extras.batch', batch_for_shader=None),
+    }
+    if importlib.util.find_spec('numpy') is None:
+        #the audio modules import numpy, which Blender always has, but the timeline functions never use it
+        modules['numpy'] = make_module('numpy')
+    for name, module in modules.items():
+        sys.modules.setdefault(name, module)
+    return bpy
@@ -38,6 +38,9 @@ from . import timeline
 from . import zoom
 from . import vseqf
 from . import vu_meter
+from . import profiling
+from . import envelopes
+from . import loudness
 from . import replace_menus
 
 
@@ -57,6 +60,8 @@ vseqf_draw_handler = None
 vu_meter_draw_handler = None
 frame_step_handler = None
 continuous_handler = None
+overlay_min_width = 1  #Pixels, selected strips narrower than this do not get any overlays
+overlay_detail_width = 30  #Pixels, strips narrower than this do not get text or tag overlays
 
 classes = []
 
@@ -90,7 +95,8 @@ classes = classes + [timeline.VSEQFMetaExit, timeline.VSEQFQuickTimeline,
 classes = classes + [zoom.VSEQFQuickZoomsMenu, zoom.VSEQFQuickZoomPresetMenu, zoom.VSEQFQuickZoomPreset,
                      zoom.VSEQFClearZooms, zoom.VSEQFRemoveZoom, zoom.VSEQFAddZoom, zoom.VSEQFQuickZooms,
                      zoom.VSEQFZoomPreset]
-classes = classes + [vu_meter.VUMeterCheckClipping]
+classes = classes + [vu_meter.VUMeterCheckClipping, loudness.VSEQFLoudnessReport]
+classes = classes + [profiling.VSEQFProfilingDump, profiling.VSEQFProfilingReset, profiling.VSEQF_PT_ProfilingPanel]
 
 
 #Menu draw functions
@@ -200,6 +206,8 @@ class VSEQFFollow(bpy.types.Operator):
 
 
 #Functions related to continuous update
+@profiling.profiled
+@vseqf.draw_batched
 def vseqf_draw():
     context = bpy.context
     prefs = vseqf.get_prefs()
@@ -226,14 +234,47 @@ def vseqf_draw():
     min_x = 25
     max_x = width - 10
     fps = vseqf.get_fps()
-    draw_strip_info(context, active_strip, fps, frame_px, channel_px, min_x, max_x, view, width, text_color, prefs.fades, context.scene.vseqf.display_length, True)
+    view_bounds = (left, right, bottom, top)
+    if strip_overlay_visible(active_strip, view_bounds, frame_px):
+        show_details = frame_px * active_strip.duration >= overlay_detail_width
+        draw_strip_info(context, active_strip, fps, frame_px, channel_px, min_x, max_x, view, width, text_color, prefs.fades, context.scene.vseqf.display_length and show_details, show_details, show_text=show_details)
+    overlay_limit = prefs.overlay_limit
+    drawn = 0
+    skipped = 0
     selected = timeline.current_selected(context)
     for strip in selected:
-        if strip != active_strip:
-            draw_strip_info(context, strip, fps, frame_px, channel_px, min_x, max_x, view, width, text_color, prefs.fades, False, True)
-
-
-def draw_strip_info(context, active_strip, fps, frame_px, channel_px, min_x, max_x, view, width, text_color, show_fades, show_length, show_markers):
+        if strip == active_strip:
+            continue
+        if not strip_overlay_visible(strip, view_bounds, frame_px):
+            continue
+        if overlay_limit and drawn >= overlay_limit:
+            skipped = skipped + 1
+            continue
+        drawn = drawn + 1
+        show_details = frame_px * strip.duration >= overlay_detail_width
+        draw_strip_info(context, strip, fps, frame_px, channel_px, min_x, max_x, view, width, text_color, prefs.fades, False, show_details, show_text=show_details)
+    if skipped:
+        vseqf.draw_text(min_x, 20, 10, '+'+str(skipped)+' more selected strips without overlays', color=text_color)
+
+
+def strip_overlay_visible(strip, view_bounds, frame_px):
+    """Checks if a strip is in the visible area of the sequencer and wide enough to be worth drawing overlays for
+    Arguments:
+        strip: VSE Strip to check
+        view_bounds: List of the visible left frame, right frame, bottom channel and top channel
+        frame_px: Float, pixels per frame in the current view
+
+    Returns: Boolean"""
+
+    view_left, view_right, view_bottom, view_top = view_bounds
+    if strip.right_handle < view_left or strip.left_handle > view_right:
+        return False
+    if strip.channel + 1 < view_bottom or strip.channel > view_top:
+        return False
+    return frame_px * strip.duration >= overlay_min_width
+
+
+def draw_strip_info(context, active_strip, fps, frame_px, channel_px, min_x, max_x, view, width, text_color, show_fades, show_length, show_markers, show_text=True):
     length = active_strip.duration
     active_x = active_strip.left_handle + (length / 2)
     active_y = active_strip.channel + 0.5
@@ -256,31 +297,56 @@ def draw_strip_info(context, active_strip, fps, frame_px, channel_px, min_x, max
 
     #display fades
     if show_fades and active_width > text_size * 6:
-        fade_curve = fades.get_fade_curve(context, active_strip, create=False)
-        if fade_curve:
-            fadein = int(fades.fades(fade_curve, active_strip, 'detect', 'in'))
-            if fadein and length:
-                fadein_percent = fadein / length
-                vseqf.draw_rect(active_left, active_top - (fade_height * 2), fadein_percent * active_width, fade_height, color=(.5, .5, 1, .75))
+        fadein, fadeout = fades.fade_cache.get_fades(context, active_strip)
+        if fadein and length:
+            fadein_percent = fadein / length
+            vseqf.draw_rect(active_left, active_top - (fade_height * 2), fadein_percent * active_width, fade_height, color=(.5, .5, 1, .75))
+            if show_text:
                 vseqf.draw_text(active_left, active_top, text_size, 'In: '+str(fadein), text_color)
-            fadeout = int(fades.fades(fade_curve, active_strip, 'detect', 'out'))
-            if fadeout and length:
-                fadeout_percent = fadeout / length
-                fadeout_width = active_width * fadeout_percent
-                vseqf.draw_rect(active_right - fadeout_width, active_top - (fade_height * 2), fadeout_width, fade_height, color=(.5, .5, 1, .75))
+        if fadeout and length:
+            fadeout_percent = fadeout / length
+            fadeout_width = active_width * fadeout_percent
+            vseqf.draw_rect(active_right - fadeout_width, active_top - (fade_height * 2), fadeout_width, fade_height, color=(.5, .5, 1, .75))
+            if show_text:
                 vseqf.draw_text(active_right - (text_size * 4), active_top, text_size, 'Out: '+str(fadeout), text_color)
 
     if show_markers:
-        for tag in active_strip.tags:
-            if tag.use_offset:
-                if active_strip.left_handle_offset < tag.offset <= active_strip.duration + active_strip.left_handle_offset:
-                    adjusted_offset = tag.offset - 1 - active_strip.left_handle_offset
-                    left = active_left + (adjusted_offset * frame_px)
-                    width = tag.length * frame_px
-                    if left + width > active_right:
-                        width = active_right - left
-                    vseqf.draw_rect(left, active_bottom, width, channel_px, color=(tag.color[0], tag.color[1], tag.color[2], 0.33))
-                    vseqf.draw_text(left, active_top, text_size, tag.text)
+        draw_strip_tags(active_strip, active_left, active_right, active_top, active_bottom, frame_px, channel_px, width, text_size)
+
+
+def draw_strip_tags(strip, strip_left, strip_right, strip_top, strip_bottom, frame_px, channel_px, region_width, text_size):
+    """Draws the tag overlays of a strip into the current draw list.  Tags outside of the region are skipped, and tag
+    labels are only drawn when they fit inside the tag.
+    Arguments:
+        strip: VSE Strip to draw the tags of
+        strip_left, strip_right, strip_top, strip_bottom: Floats, region coordinates of the strip edges
+        frame_px: Float, pixels per frame in the current view
+        channel_px: Float, pixels per channel in the current view
+        region_width: Integer, width of the region in pixels
+        text_size: Integer, font size of the tag labels"""
+
+    tags = strip.tags
+    if len(tags) == 0:
+        return
+    offset_start = strip.left_handle_offset
+    offset_end = strip.duration + offset_start
+    for tag in tags:
+        if not tag.use_offset:
+            continue
+        offset = tag.offset
+        if not offset_start < offset <= offset_end:
+            continue
+        left = strip_left + ((offset - 1 - offset_start) * frame_px)
+        tag_width = tag.length * frame_px
+        if left + tag_width > strip_right:
+            tag_width = strip_right - left
+        if left + tag_width < 0 or left > region_width:
+            continue
+        color = tag.color
+        vseqf.draw_rect(left, strip_bottom, tag_width, channel_px, color=(color[0], color[1], color[2], 0.33))
+        text = tag.text
+        if text and tag_width >= vseqf.text_dimensions(text, text_size)[0]:
+            vseqf.draw_text(left, strip_top, text_size, text)
 
 
 #Functions related to QuickSpeed
@@ -302,6 +368,46 @@ def frame_step(scene):
     scene.vseqf.last_frame = scene.frame_current
 
 
+#Functions related to cached strip data
+@persistent
+def strips_changed(scene, depsgraph):
+    """Handler that marks the cached strip geometry and marker index as changed when a scene has been changed, and
+    clears the cached fades when an action has been changed
+    Arguments:
+        scene: the current Scene
+        depsgraph: the evaluated Depsgraph"""
+
+    del scene
+    if depsgraph.id_type_updated('SCENE'):
+        timeline.strip_geometry_tag_changed()
+        markers.marker_index_tag_changed()
+    if depsgraph.id_type_updated('ACTION'):
+        fades.fade_cache_tag_changed()
+
+
+@persistent
+def timeline_reloaded(*_):
+    """Handler that marks the cached strip geometry, marker index and fades as invalid after undo, redo or loading a
+    file"""
+    timeline.strip_geometry_tag_invalid()
+    markers.marker_index_tag_changed()
+    fades.fade_cache_tag_changed()
+
+
+@persistent
+def timeline_file_loaded(*_):
+    """Handler that marks the cached strip geometry, marker index, fades and audio levels as invalid and renews msgbus
+    subscriptions after loading a file"""
+    vseqf.redraw_scheduler.cancel()
+    timeline.strip_geometry_tag_invalid()
+    markers.marker_index_tag_changed()
+    fades.fade_cache_tag_changed()
+    envelopes.envelope_builder.cancel()
+    envelopes.clear_envelopes()
+    timeline.subscribe_strip_changes()
+    markers.subscribe_marker_changes()
+
+
 def draw_quickspeed_header(self, context):
     """Draws the speed selector in the sequencer header"""
     layout = self.layout
@@ -465,6 +571,11 @@ class VSEQFSetting(bpy.types.PropertyGroup):
         default=True)
 
 
+def update_profile_draw(self, context):
+    del context
+    profiling.set_enabled(self.profile_draw)
+
+
 class VSEQuickFunctionSettings(bpy.types.AddonPreferences):
     """Addon preferences for QuickFunctions, used to enable and disable features"""
     bl_idname = __name__
@@ -490,6 +601,33 @@ class VSEQuickFunctionSettings(bpy.types.AddonPreferences):
     context_menu: bpy.props.BoolProperty(
         name="Enable Right-Click Menus (In Left-Click Mode)",
         default=True)
+    overlay_limit: bpy.props.IntProperty(
+        name="Selected Strip Overlay Limit",
+        default=100,
+        min=0,
+        description="Maximum number of selected strips to draw info overlays for, 0 for no limit")
+    vu_max_fps: bpy.props.IntProperty(
+        name="VU Meter Max Redraws Per Second",
+        default=30,
+        min=0,
+        description="Limits how often the VU meter redraws the sequencer during playback, 0 for no limit")
+    profile_draw: bpy.props.BoolProperty(
+        name="Profile Draw Handlers",
+        default=False,
+        update=update_profile_draw,
+        description="Record how long each overlay takes to draw, shown in the VSEQF Draw Timings panel in the sequencer sidebar")
+    envelope_cache_size: bpy.props.IntProperty(
+        name="Audio Level Cache Size (MB)",
+        default=512,
+        min=0,
+        description="Disk space used to save the measured audio levels of sound files between sessions, 0 to disable",
+        update=envelopes.cache_directory_tag_changed)
+    envelope_cache_directory: bpy.props.StringProperty(
+        name="Audio Level Cache Folder",
+        default='',
+        subtype='DIR_PATH',
+        description="Folder to save measured audio levels in, leave empty to use the Blender user data folder",
+        update=envelopes.cache_directory_tag_changed)
 
     def draw(self, context):
         layout = self.layout
@@ -500,10 +638,16 @@ class VSEQuickFunctionSettings(bpy.types.AddonPreferences):
         layout.prop(self, "edit")
         layout.prop(self, "threepoint")
         layout.prop(self, "context_menu")
+        layout.prop(self, "overlay_limit")
+        layout.prop(self, "vu_max_fps")
+        layout.prop(self, "profile_draw")
+        layout.prop(self, "envelope_cache_size")
+        layout.prop(self, "envelope_cache_directory")
 
 
 def remove_vu_draw_handler(add=False):
     global vu_meter_draw_handler
+    vu_meter.clear_vu_meter_backgrounds()
     if vu_meter_draw_handler:
         try:
             bpy.types.SpaceSequenceEditor.draw_handler_remove(vu_meter_draw_handler, 'WINDOW')
@@ -527,6 +671,29 @@ def remove_frame_step_handler(add=False):
         frame_step_handler = handlers.append(frame_step)
 
 
+def remove_timeline_handlers(add=False):
+    handlers = bpy.app.handlers
+    timeline_handlers = [
+        [handlers.depsgraph_update_post, strips_changed],
+        [handlers.load_post, timeline_file_loaded],
+        [handlers.undo_post, timeline_reloaded],
+        [handlers.redo_post, timeline_reloaded]
+    ]
+    for handler_list, handler in timeline_handlers:
+        if handler in handler_list:
+            handler_list.remove(handler)
+        if add:
+            handler_list.append(handler)
+    if add:
+        timeline.subscribe_strip_changes()
+        markers.subscribe_marker_changes()
+    else:
+        timeline.unsubscribe_strip_changes()
+        markers.unsubscribe_marker_changes()
+    timeline.strip_geometry_tag_invalid()
+    markers.marker_index_tag_changed()
+
+
 #Register properties, operators, menus and shortcuts
 classes = classes + [VSEQFSettingsMenu, VSEQFSetting, VSEQFFollow]
 classes = classes + [replace_menus.SEQUENCER_MT_strip, replace_menus.SEQUENCER_MT_strip_transform, replace_menus.SEQUENCER_MT_add]
@@ -615,6 +782,12 @@ def register_keymaps():
         keymapitem.properties.type = 'LASTEDGE'
         keymapitem = keymapitems.new('vseqf.skip_timeline', 'NUMPAD_6', 'PRESS', ctrl=True)
         keymapitem.properties.type = 'NEXTEDGE'
+        keymapitem = keymapitems.new('vseqf.skip_timeline', 'NUMPAD_4', 'PRESS', ctrl=True, shift=True)
+        keymapitem.properties.type = 'LASTEDGE'
+        keymapitem.properties.selected = True
+        keymapitem = keymapitems.new('vseqf.skip_timeline', 'NUMPAD_6', 'PRESS', ctrl=True, shift=True)
+        keymapitem.properties.type = 'NEXTEDGE'
+        keymapitem.properties.selected = True
         keymapitem = keymapitems.new('vseqf.skip_timeline', 'NUMPAD_7', 'PRESS', ctrl=True)
         keymapitem.properties.type = 'LASTMARKER'
         keymapitem = keymapitems.new('vseqf.skip_timeline', 'NUMPAD_9', 'PRESS', ctrl=True)
@@ -720,8 +893,10 @@ def register():
     disable_tweak_default_keymaps()
 
     #Register handlers
+    profiling.set_enabled(vseqf.get_prefs().profile_draw)
     remove_frame_step_handler(add=True)
     remove_vu_draw_handler(add=True)
+    remove_timeline_handlers(add=True)
 
 
 def unregister():
@@ -746,8 +921,14 @@ def unregister():
             keymapitems.remove(keymapitem)
 
     #Remove handlers
+    vseqf.redraw_scheduler.cancel()
+    profiling.set_enabled(False)
     remove_vu_draw_handler()
+    vseqf.draw_registry.clear()
+    envelopes.envelope_builder.cancel()
+    envelopes.clear_envelopes()
     remove_frame_step_handler()
+    remove_timeline_handlers()
 
     try:
         bpy.utils.unregister_class(VSEQuickFunctionSettings)
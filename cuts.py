@@ -148,8 +148,7 @@ class VSEQFCut(bpy.types.Operator):
                 direction = 'previous'
             else:
                 direction = 'next'
-            strips = timeline.current_strips(context)
-            merge_to = timeline.find_close_strip(strips, strip, direction=direction, mode='channel', sounds=True)
+            merge_to = timeline.find_close_strip(None, strip, direction=direction, mode='channel', sounds=True)
             if merge_to:
                 if not timeline.is_locked(sequencer, merge_to):
                     source_matches = self.check_source(strip, merge_to)
@@ -169,12 +168,8 @@ class VSEQFCut(bpy.types.Operator):
             insert = self.insert
         else:
             insert = context.scene.vseqf.quickcuts_insert
-        strips = timeline.current_strips(context)
-        if context.scene.vseqf.ripple_markers:
-            markers = context.scene.timeline_markers
-        else:
-            markers = []
-        grabs.ripple_timeline(context.scene.sequence_editor, strips, cut_frame - 1, insert, markers=markers)
+        moved = grabs.ripple_timeline(context.scene.sequence_editor, None, cut_frame - 1, insert, move_markers=context.scene.vseqf.ripple_markers)
+        self.report({'INFO'}, 'Moved '+str(moved)+' strips')
 
     def start_cut(self, context, cut_frame, side="BOTH"):
         sequencer = context.scene.sequence_editor
@@ -263,6 +258,7 @@ class VSEQFCut(bpy.types.Operator):
                     strip.right_handle = cut_frame
                 if action == 'SLIDE':
                     strip.content_start = strip.content_start + ripple_amount
+        timeline.get_strip_index(context).update_strips(to_cut)
 
         #ripple
         if action == 'RIPPLE':
@@ -271,11 +267,8 @@ class VSEQFCut(bpy.types.Operator):
             else:
                 ripple_frame = cut_frame
             insert = 0 - ripple_amount
-            if context.scene.vseqf.ripple_markers:
-                markers = context.scene.timeline_markers
-            else:
-                markers = []
-            grabs.ripple_timeline(sequencer, strips, ripple_frame - 1, insert, markers=markers)
+            moved = grabs.ripple_timeline(sequencer, None, ripple_frame - 1, insert, move_markers=context.scene.vseqf.ripple_markers)
+            self.report({'INFO'}, 'Moved '+str(moved)+' strips')
 
         if side == 'LEFT':
             if action in ['RIPPLE', 'SLIDE']:
@@ -452,37 +445,17 @@ class VSEQFDelete(bpy.types.Operator):
         if not to_delete:
             return {'CANCELLED'}
 
-        #Determine frames that need to be rippled
-        ripple_frames = set()
-        for deletable in to_delete:
-            delete_start = deletable.left_handle
-            delete_end = deletable.right_handle
-            for frame in range(delete_start, delete_end+1):
-                ripple_frames.add(frame)
+        #Determine frame ranges that need to be rippled
+        ripple_ranges = timeline.merge_intervals([[deletable.left_handle, deletable.right_handle] for deletable in to_delete])
 
         #Delete selected
         bpy.ops.sequencer.delete()
 
         if self.ripple:
             #Ripple remaining strips
-            strips = timeline.current_strips(context)
-            ripple_frames = list(ripple_frames)
-            ripple_frames.sort()
-            start_frame = ripple_frames[0]
-            end_frame = ripple_frames[0]
-            ripple_frames.append(ripple_frames[-1]+2)
-            for frame in ripple_frames:
-                if frame - end_frame > 1:
-                    #Ripple section, start next section
-                    ripple_length = end_frame - start_frame
-                    if context.scene.vseqf.ripple_markers:
-                        markers = context.scene.timeline_markers
-                    else:
-                        markers = []
-                    grabs.ripple_timeline(context.scene.sequence_editor, strips, start_frame, -ripple_length, markers=markers)
-                    start_frame = frame
-                end_frame = frame
-            context.scene.frame_current = ripple_frames[0]
+            moved = grabs.ripple_gaps(ripple_ranges, move_markers=context.scene.vseqf.ripple_markers)
+            context.scene.frame_current = ripple_ranges[0][0]
+            self.report({'INFO'}, 'Moved '+str(moved)+' strips')
         self.reset()
         return {'FINISHED'}
 
@@ -0,0 +1,425 @@
+import bpy
+import os
+import math
+import numpy
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from . import vseqf
+
+envelope_chunk_seconds = 10  #Length of audio decoded at once when building an envelope
+envelope_workers = 2  #Number of sounds that can be decoded at once in the background
+envelopes = {}  #envelope key: Envelope
+failed_envelopes = set()  #envelope keys of sounds that could not be decoded, not retried until clear_envelopes()
+cache_directory = None  #folder envelopes are saved in, '' if the disk cache is disabled, None if not found yet
+
+
+class Envelope(object):
+    """Per-frame peak and RMS levels of a sound, so levels can be read without decoding audio"""
+
+    def __init__(self, peaks, rms, fps):
+        self.peaks = peaks
+        self.rms = rms
+        self.fps = fps
+
+    def __len__(self):
+        return len(self.peaks)
+
+    def peak(self, sound_frame):
+        """Finds the highest level in the two frames around a point in the sound, matching the window read by
+        get_volume_unit
+        Arguments:
+            sound_frame: Float, frame in the sound, counted from the start of the sound
+
+        Returns: Float"""
+
+        first = max(math.floor(sound_frame - 1), 0)
+        last = min(math.ceil(sound_frame + 1), len(self.peaks))
+        if last <= first:
+            return 0
+        return float(self.peaks[first:last].max())
+
+    def peaks_at(self, sound_frames):
+        """Same as peak, for a whole array of frames at once
+        Arguments:
+            sound_frames: numpy array of frames in the sound
+
+        Returns: numpy array of levels"""
+
+        count = len(self.peaks)
+        levels = numpy.zeros(len(sound_frames), dtype=numpy.float32)
+        if not count:
+            return levels
+        first = numpy.floor(sound_frames - 1).astype(numpy.int64)
+        last = numpy.ceil(sound_frames + 1).astype(numpy.int64)
+        for offset in range(3):
+            indices = first + offset
+            valid = (indices >= 0) & (indices < last) & (indices < count)
+            levels = numpy.where(valid, numpy.maximum(levels, self.peaks[numpy.clip(indices, 0, count - 1)]), levels)
+        return levels
+
+
+def envelope_key(sound, fps):
+    """Finds the key that an envelope for a sound is stored under
+    Arguments:
+        sound: Sound datablock
+        fps: Float, frames per second the envelope is measured at
+
+    Returns: Tuple"""
+
+    if sound.filepath:
+        path = bpy.path.abspath(sound.filepath, library=sound.library)
+    else:
+        path = 'Sound:'+sound.name
+    return (path, round(fps, 3))
+
+
+def frame_levels(data, boundaries):
+    """Reduces a block of samples to per-frame peak and RMS levels
+    Arguments:
+        data: numpy array of samples, one column per channel
+        boundaries: numpy array of the first sample of each frame in data
+
+    Returns: List of peak levels array, RMS levels array"""
+
+    if data.ndim > 1:
+        levels = numpy.abs(data).max(axis=1)
+        squares = numpy.square(data, dtype=numpy.float64).mean(axis=1)
+    else:
+        levels = numpy.abs(data)
+        squares = numpy.square(data, dtype=numpy.float64)
+    counts = numpy.diff(numpy.append(boundaries, len(levels)))
+    peaks = numpy.maximum.reduceat(levels, boundaries)
+    rms = numpy.sqrt(numpy.add.reduceat(squares, boundaries) / counts)
+    return [peaks.astype(numpy.float32), rms.astype(numpy.float32)]
+
+
+def build_envelope(factory, fps, progress=None):
+    """Decodes a sound a chunk at a time and measures the peak and RMS level of each frame
+    Arguments:
+        factory: aud.Sound to measure
+        fps: Float, frames per second to measure at
+        progress: Optional function, called with the number of seconds decoded after each chunk
+
+    Returns: Envelope"""
+
+    rate = factory.specs[0]
+    samples_per_frame = rate / fps
+    frames_per_chunk = max(int(fps * envelope_chunk_seconds), 1)
+    peaks = []
+    rms = []
+    chunk_frame = 0
+    while True:
+        next_chunk_frame = chunk_frame + frames_per_chunk
+        start_sample = int(round(chunk_frame * samples_per_frame))
+        end_sample = int(round(next_chunk_frame * samples_per_frame))
+        data = factory.limit(start_sample / rate, end_sample / rate).data()
+        if len(data) == 0:
+            break
+        boundaries = numpy.round(numpy.arange(chunk_frame, next_chunk_frame) * samples_per_frame).astype(numpy.int64) - start_sample
+        boundaries = boundaries[boundaries < len(data)]
+        chunk_peaks, chunk_rms = frame_levels(data, boundaries)
+        peaks.append(chunk_peaks)
+        rms.append(chunk_rms)
+        if progress is not None:
+            progress(next_chunk_frame / fps)
+        if len(data) < end_sample - start_sample:
+            break
+        chunk_frame = next_chunk_frame
+    if peaks:
+        return Envelope(numpy.concatenate(peaks), numpy.concatenate(rms), fps)
+    return Envelope(numpy.zeros(0, dtype=numpy.float32), numpy.zeros(0, dtype=numpy.float32), fps)
+
+
+def get_envelope(sound, fps, depsgraph=None, build=True, background=False, length=0):
+    """Returns the envelope of a sound.  Envelopes are looked for in memory, then in the disk cache, and if not found
+    they are built by decoding the sound.
+    Arguments:
+        sound: Sound datablock
+        fps: Float, frames per second of the scene
+        depsgraph: Depsgraph to evaluate the sound with, the current one is used if not given
+        build: Boolean, if False, None is returned for sounds that would need to be decoded
+        background: Boolean, if True, sounds that need to be decoded are queued on envelope_builder and None is
+            returned until they are ready
+        length: Float, length of the sound in seconds if known, used for background progress reporting
+
+    Returns: Envelope, or None"""
+
+    key = envelope_key(sound, fps)
+    envelope = envelopes.get(key)
+    if envelope is not None:
+        return envelope
+    if key in failed_envelopes or (background and envelope_builder.is_building(key)):
+        return None
+    cache_file = disk_cache_file(key[0], fps)
+    if cache_file is not None:
+        envelope = load_envelope(cache_file, fps)
+    if envelope is None and build:
+        if depsgraph is None:
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+        factory = sound.evaluated_get(depsgraph).factory
+        if background:
+            envelope_builder.request(key, factory, fps, cache_file, length)
+            return None
+        envelope = build_envelope(factory, fps)
+        if cache_file is not None:
+            save_envelope(cache_file, envelope)
+    if envelope is not None:
+        envelopes[key] = envelope
+    return envelope
+
+
+class EnvelopeBuildCancelled(Exception):
+    pass
+
+
+class EnvelopeJob(object):
+    def __init__(self, key, future, fps, cache_file, length):
+        self.key = key
+        self.future = future
+        self.fps = fps
+        self.cache_file = cache_file
+        self.length = length
+        self.decoded = 0
+
+
+class EnvelopeBuilder(object):
+    """Decodes sounds and builds their envelopes on worker threads.  Finished envelopes are added to the envelope cache
+    and saved to disk from a bpy.app.timers callback on the main thread, and the progress of all queued sounds is shown
+    in the window progress indicator."""
+
+    def __init__(self):
+        self.executor = None
+        self.jobs = {}  #envelope key: EnvelopeJob
+        self.cancelled = False
+        self.timer = vseqf.AppTimer(self.check)
+
+    def is_building(self, key):
+        return key in self.jobs
+
+    def request(self, key, factory, fps, cache_file, length=0):
+        """Queues a sound to have its envelope built
+        Arguments:
+            key: Tuple, envelope key of the sound
+            factory: aud.Sound to decode
+            fps: Float, frames per second to measure at
+            cache_file: String path to save the envelope to when done, or None
+            length: Float, length of the sound in seconds, used for progress reporting"""
+
+        if key in self.jobs:
+            return
+        if self.executor is None:
+            self.cancelled = False
+            self.executor = ThreadPoolExecutor(max_workers=envelope_workers, thread_name_prefix='vseqf_envelope')
+        job = EnvelopeJob(key, None, fps, cache_file, length)
+
+        def progress(seconds):
+            if self.cancelled:
+                raise EnvelopeBuildCancelled()
+            job.decoded = seconds
+
+        job.future = self.executor.submit(build_envelope, factory, fps, progress)
+        if not self.jobs:
+            window_manager = bpy.context.window_manager
+            if window_manager is not None:
+                window_manager.progress_begin(0, 100)
+        self.jobs[key] = job
+        if not self.timer.is_running():
+            self.timer.start(first_interval=0.1)
+
+    def check(self):
+        """Timer callback, stores finished envelopes and updates the progress indicator"""
+
+        finished = False
+        for key, job in list(self.jobs.items()):
+            if not job.future.done():
+                continue
+            del self.jobs[key]
+            try:
+                envelope = job.future.result()
+            except Exception as e:
+                print('Unable to measure audio levels of: '+key[0]+' : '+str(e))
+                failed_envelopes.add(key)
+                continue
+            if job.cache_file is not None:
+                save_envelope(job.cache_file, envelope)
+            envelopes[key] = envelope
+            finished = True
+        if finished:
+            vseqf.redraw_sequencers()
+        window_manager = bpy.context.window_manager
+        if not self.jobs:
+            if window_manager is not None:
+                window_manager.progress_end()
+            return None
+        if window_manager is not None:
+            window_manager.progress_update(self.progress() * 100)
+        return 0.1
+
+    def progress(self):
+        """Returns the portion of the queued sounds that has been decoded, from 0 to 1"""
+
+        total = 0
+        decoded = 0
+        for job in self.jobs.values():
+            if job.length:
+                total = total + job.length
+                decoded = decoded + min(job.decoded, job.length)
+        if not total:
+            return 0
+        return decoded / total
+
+    def cancel(self):
+        """Stops all background work and forgets the queued sounds, call when unregistering the addon or loading a file"""
+
+        self.cancelled = True
+        self.timer.stop()
+        if self.jobs:
+            window_manager = bpy.context.window_manager
+            if window_manager is not None:
+                window_manager.progress_end()
+        self.jobs = {}
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+envelope_builder = EnvelopeBuilder()
+
+
+def get_cache_directory():
+    """Finds the folder that envelopes are saved in, creating it if needed.  The folder is only looked for once, until
+    cache_directory_tag_changed() is called.
+    Returns: String path, or None if the disk cache is disabled"""
+
+    global cache_directory
+    if cache_directory is None:
+        cache_directory = ''
+        prefs = vseqf.get_prefs()
+        if prefs.envelope_cache_size:
+            directory = bpy.path.abspath(prefs.envelope_cache_directory)
+            if not directory:
+                directory = bpy.utils.user_resource('DATAFILES', path='vseqf_envelopes')
+            try:
+                os.makedirs(directory, exist_ok=True)
+                cache_directory = directory
+            except OSError:
+                pass
+    return cache_directory or None
+
+
+def cache_directory_tag_changed(*_):
+    #Called when the cache preferences are changed, or a file is loaded and relative paths may point somewhere else
+    global cache_directory
+    cache_directory = None
+
+
+def disk_cache_file(path, fps):
+    """Finds the cache file an envelope for a sound file is saved to.  The name is made from the absolute path, size and
+    modified time of the sound file and the fps, so changed files get a new envelope.
+    Arguments:
+        path: String, absolute path to the sound file
+        fps: Float, frames per second of the envelope
+
+    Returns: String path, or None if the sound is not a file on disk or the disk cache is disabled"""
+
+    try:
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    directory = get_cache_directory()
+    if directory is None:
+        return None
+    file_key = repr((os.path.normcase(path), stat.st_size, stat.st_mtime_ns, round(fps, 3)))
+    return os.path.join(directory, hashlib.sha1(file_key.encode('utf-8')).hexdigest()+'.npy')
+
+
+def load_envelope(cache_file, fps):
+    """Opens a saved envelope as a memory-mapped array, so only the parts that are read are loaded from disk
+    Returns: Envelope, or None if the file does not exist or can't be read"""
+
+    try:
+        levels = numpy.load(cache_file, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    if levels.ndim != 2 or levels.shape[0] != 2:
+        return None
+    try:
+        #mark as recently used for the cache size limit
+        os.utime(cache_file)
+    except OSError:
+        pass
+    return Envelope(levels[0], levels[1], fps)
+
+
+def save_envelope(cache_file, envelope):
+    #Saves an envelope to the disk cache, then removes the least recently used envelopes if the cache is too large
+    levels = numpy.stack((envelope.peaks, envelope.rms))
+    temp_file = cache_file+'.tmp'
+    try:
+        with open(temp_file, 'wb') as save_file:
+            numpy.save(save_file, levels)
+        os.replace(temp_file, cache_file)
+    except OSError:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+        return
+    limit_disk_cache(os.path.dirname(cache_file), vseqf.get_prefs().envelope_cache_size * 1024 * 1024)
+
+
+def limit_disk_cache(directory, max_bytes):
+    """Removes the least recently used envelope files until the cache folder is no larger than max_bytes
+    Arguments:
+        directory: String, path to the cache folder
+        max_bytes: Integer, size limit of the cache"""
+
+    cache_files = []
+    total = 0
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.endswith('.npy') and entry.is_file():
+                    stat = entry.stat()
+                    cache_files.append((stat.st_mtime, stat.st_size, entry.path))
+                    total = total + stat.st_size
+    except OSError:
+        return
+    cache_files.sort()
+    for modified, size, path in cache_files:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total = total - size
+        except OSError:
+            #file may be in use
+            pass
+
+
+def strip_peak(strip, frame, fps, depsgraph=None, build=True, background=False):
+    """Finds the peak level of a sound strip around a timeline frame, before the strip volume is applied
+    Arguments:
+        strip: Sound Strip
+        frame: Integer, timeline frame
+        fps: Float, frames per second of the scene
+        depsgraph: Depsgraph to evaluate the sound with if it needs to be measured
+        build: Boolean, if False, None is returned for sounds that have not been measured yet
+        background: Boolean, if True, sounds that have not been measured are queued to be measured in the background,
+            and None is returned until they are ready
+
+    Returns: Float, or None"""
+
+    envelope = get_envelope(strip.sound, fps, depsgraph=depsgraph, build=build, background=background, length=strip.content_duration / fps)
+    if envelope is None:
+        return None
+    return envelope.peak(frame - strip.content_start)
+
+
+def clear_envelopes():
+    """Forgets the envelopes in memory and the sounds that could not be measured, they will be loaded from the disk
+    cache or measured again when needed"""
+
+    envelopes.clear()
+    failed_envelopes.clear()
+    cache_directory_tag_changed()
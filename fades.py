@@ -1,8 +1,10 @@
 import bpy
-import gpu
+import bisect
 from gpu_extras.batch import batch_for_shader
 import math
+from array import array
 from . import vseqf
+from . import profiling
 from . import timeline
 
 
@@ -39,6 +41,11 @@ def fix_fade_out(context, strip, old_end):
 
 
 def find_crossfade(strips, first_strip, second_strip):
+    if strips is None:
+        crossfade = timeline.get_strip_geometry().find_crossfade(first_strip, second_strip)
+        if crossfade is None:
+            return False
+        return crossfade
     for strip in strips:
         if hasattr(strip, 'input_1') and hasattr(strip, 'input_2'):
             if (strip.input_1 == first_strip and strip.input_2 == second_strip) or (strip.input_2 == first_strip and strip.input_1 == second_strip):
@@ -56,10 +63,11 @@ def vseqf_crossfade(first_strip, second_strip):
     frame_start = first_strip.right_handle
     frame_end = second_strip.left_handle
     channel = first_strip.channel
-    while timeline.sequencer_area_filled(frame_start, frame_end, channel, channel, []):
-        channel = channel + 1
+    index = timeline.get_strip_index()
+    channel = index.find_free_channel(frame_start, frame_end, channel)
     length = frame_end - frame_start
-    bpy.context.scene.sequence_editor.strips.new_effect(name=transition_type, type=transition_type, channel=channel,  frame_start=frame_start, length=length, input1=first_strip, input2=second_strip)
+    crossfade = bpy.context.scene.sequence_editor.strips.new_effect(name=transition_type, type=transition_type, channel=channel,  frame_start=frame_start, length=length, input1=first_strip, input2=second_strip)
+    index.add(crossfade)
 
 
 def get_fade_curve(context, strip, create=False):
@@ -111,6 +119,94 @@ def get_fade_curve(context, strip, create=False):
     return None
 
 
+class FadeCache(object):
+    """Remembers the fade curves of the scene action by data path, and the detected fade lengths of strips, so overlays
+    can be drawn without searching every fcurve on every redraw.
+    The curves are found again when the action or its number of fcurves changes, or when fade_cache_tag_changed is
+    called from the depsgraph handler.  A strip's fade lengths are detected again when its handles, name or number of
+    fade keyframes change."""
+
+    def __init__(self):
+        self.curves_key = None
+        self.curves = {}  #data path: fcurve
+        self.fades = {}  #strip pointer: (validation key, fade in, fade out)
+
+    def clear(self):
+        self.curves_key = None
+        self.curves = {}
+        self.fades = {}
+
+    def get_curves(self, scene):
+        """Returns a dictionary of the fcurves of a scene's action, keyed by data path
+        Arguments:
+            scene: Scene to find the fcurves of
+
+        Returns: Dictionary of data path: fcurve"""
+
+        animation_data = scene.animation_data
+        if not animation_data or not animation_data.action:
+            self.clear()
+            return self.curves
+        action = animation_data.action
+        all_curves = get_action_fcurves(action)
+        if all_curves is None:
+            self.clear()
+            return self.curves
+        curves_key = (action.as_pointer(), len(all_curves))
+        if curves_key != self.curves_key:
+            self.curves = {}
+            self.fades = {}
+            for curve in all_curves:
+                self.curves[curve.data_path] = curve
+            self.curves_key = curves_key
+        return self.curves
+
+    def get_fade_curve(self, context, strip):
+        """Finds the fade curve of a strip without creating one, same as get_fade_curve with create=False"""
+
+        if strip.type == 'SOUND':
+            fade_variable = 'volume'
+        else:
+            fade_variable = 'blend_alpha'
+        curves = self.get_curves(context.scene)
+        if not curves:
+            return None
+        curve = curves.get('sequence_editor.strips_all["'+strip.name+'"].'+fade_variable)
+        if curve is None:
+            curve = curves.get('sequence_editor.sequences_all["'+strip.name+'"].'+fade_variable)
+        return curve
+
+    def get_fades(self, context, strip):
+        """Returns the detected fade in and fade out lengths of a strip
+        Arguments:
+            context: Blender context
+            strip: VSE Strip to check
+
+        Returns: List of fade in length, fade out length"""
+
+        fade_curve = self.get_fade_curve(context, strip)
+        if fade_curve is None:
+            return [0, 0]
+        key = (strip.left_handle, strip.right_handle, strip.name, len(fade_curve.keyframe_points))
+        pointer = strip.as_pointer()
+        cached = self.fades.get(pointer)
+        if cached is not None and cached[0] == key:
+            return [cached[1], cached[2]]
+        fade_in = int(fades(fade_curve, strip, 'detect', 'in'))
+        fade_out = int(fades(fade_curve, strip, 'detect', 'out'))
+        self.fades[pointer] = (key, fade_in, fade_out)
+        return [fade_in, fade_out]
+
+
+fade_cache = FadeCache()
+
+
+def fade_cache_tag_changed():
+    """Clears the cached fade curves and fade lengths, call when an action has been changed"""
+
+    fade_cache.clear()
+
+
 def fades(fade_curve, strip, mode, direction, fade_length=0, fade_low_point_frame=False):
     """Detects, creates, and edits fadein and fadeout for strips.
     Arguments:
@@ -296,6 +392,8 @@ def set_fade(fade_curve, direction, fade_low_point_frame, fade_high_point_frame,
         fade_keyframes.insert(frame=fade_low_point_frame, value=0)
 
 
+@profiling.profiled
+@vseqf.draw_batched
 def fade_operator_draw(self, context):
     #Draw current fade info overlays
     region = context.region
@@ -319,29 +417,49 @@ def fade_operator_draw(self, context):
             vseqf.draw_text(fade_out_loc, strip_top - 12, 11, str(int(fade_out)), justify='right', color=(1, 1, 1, 1))
 
 
+@profiling.profiled
 def volume_operator_draw(self, context):
-    coords = []
+    if self.line_batch is None or self.line_batch_version != self.curve_version:
+        coords = volume_curve_coords(self)
+        if coords:
+            self.line_batch = batch_for_shader(self.line_shader, 'LINES', {'pos': coords})
+        else:
+            self.line_batch = False
+        self.line_batch_version = self.curve_version
+    if not self.line_batch:
+        return
+    self.line_shader.bind()
+    self.line_shader.uniform_float('color', (1, .5, .5, .5))
+    self.line_batch.draw(self.line_shader)
+
+
+def volume_curve_coords(self):
+    """Finds the line coordinates for the visible part of the volume curve being drawn by VSEQFModalVolumeDraw
+    Returns: List of coordinate pairs, one pair for each line"""
+
     keyframes = self.curve.keyframe_points
+    total = len(keyframes)
+    if total < 2:
+        return []
+    points = array('f', [0.0]) * (total * 2)
+    keyframes.foreach_get('co', points)
+    frames = points[0::2]
+    values = points[1::2]
+
+    #include the points just outside the visible range so lines continue off the edges
+    first = max(bisect.bisect_left(frames, self.visible_frame_start) - 1, 0)
+    last = min(bisect.bisect_right(frames, self.visible_frame_end) + 1, total)
+    coords = []
     last_coords = None
-    for keyframe in keyframes:
-        point = keyframe.co
-        ypos = self.active_bottom + (point[1] * self.channel_px)
-        xpos = self.active_left + ((point[0] - self.active_strip.left_handle) * self.frame_px)
+    for index in range(first, last):
+        xpos = self.active_left + ((frames[index] - self.active_strip.left_handle) * self.frame_px)
+        ypos = self.active_bottom + (values[index] * self.channel_px)
         current_coords = (xpos, ypos)
-        if point[0] < self.active_frame_start:
-            last_coords = current_coords
-            continue
         if last_coords is not None:
             coords.append(last_coords)
             coords.append(current_coords)
         last_coords = current_coords
-        if point[0] > self.active_frame_end:
-            break
-    shader = gpu.shader.from_builtin('UNIFORM_COLOR')
-    batch = batch_for_shader(shader, 'LINES', {'pos': coords})
-    shader.bind()
-    shader.uniform_float('color', (1, .5, .5, .5))
-    batch.draw(shader)
+    return coords
 
 
 class VSEQFModalVolumeDraw(bpy.types.Operator):
@@ -358,9 +476,15 @@ class VSEQFModalVolumeDraw(bpy.types.Operator):
     active_top = 0
     active_frame_start = 0
     active_frame_end = 0
+    visible_frame_start = 0
+    visible_frame_end = 0
     mode = 'ADD'
     last_press = ''
     last_added = None
+    curve_version = 0
+    line_batch = None
+    line_batch_version = -1
+    line_shader = None
 
     def remove_draw_handler(self, context):
         bpy.types.SpaceSequenceEditor.draw_handler_remove(self._handle, 'WINDOW')
@@ -368,15 +492,14 @@ class VSEQFModalVolumeDraw(bpy.types.Operator):
         context.workspace.status_text_set(None)
 
     def update_areas(self, context):
-        for area in context.screen.areas:
-            if area.type in ['GRAPH_EDITOR', 'SEQUENCE_EDITOR']:
-                area.tag_redraw()
+        vseqf.redraw_areas(['GRAPH_EDITOR', 'SEQUENCE_EDITOR'])
 
     def reset_curve(self):
         keyframes = self.curve.keyframe_points
         for keyframe in reversed(keyframes):
             keyframes.remove(keyframe)
         self.active_strip.volume = 1
+        self.curve_version = self.curve_version + 1
 
     def modal(self, context, event):
         area = context.area
@@ -431,6 +554,7 @@ class VSEQFModalVolumeDraw(bpy.types.Operator):
                 except:
                     pass
                 context.evaluated_depsgraph_get().update()
+            self.curve_version = self.curve_version + 1
             #context.area.tag_redraw()
             self.update_areas(context)
 
@@ -483,6 +607,12 @@ class VSEQFModalVolumeDraw(bpy.types.Operator):
             return {'CANCELLED'}
         self.active_frame_start = active_strip.left_handle
         self.active_frame_end = active_strip.right_handle
+        self.visible_frame_start = max(self.active_frame_start, math.floor(left))
+        self.visible_frame_end = min(self.active_frame_end, math.ceil(right))
+        self.curve_version = 0
+        self.line_batch = None
+        self.line_batch_version = -1
+        self.line_shader = vseqf.draw_registry.get_shader('UNIFORM_COLOR')
         shown_width = right - left
         shown_height = top - bottom
         self.channel_px = height / shown_height
@@ -493,7 +623,7 @@ class VSEQFModalVolumeDraw(bpy.types.Operator):
         context.window_manager.modal_handler_add(self)
         args = (self, context)
         self._handle = bpy.types.SpaceSequenceEditor.draw_handler_add(volume_operator_draw, args, 'WINDOW', 'POST_PIXEL')
-        context.area.tag_redraw()
+        vseqf.redraw_area(context.area)
         bpy.ops.ed.undo_push()
         #bpy.ops.ed.undo_push()
         return {'RUNNING_MODAL'}
@@ -587,7 +717,7 @@ class VSEQFModalFades(bpy.types.Operator):
         #Override movement if snapping is enabled
         snapping = False
         if event.ctrl and self.snap_edges:
-            self.snap_to_frame = min(self.snap_edges, key=lambda x: abs(x - mouse_frame))
+            self.snap_to_frame = timeline.find_edge_frame(self.snap_edges, mouse_frame, 'closest')
             snapping = True
 
         #Display information
@@ -658,7 +788,7 @@ class VSEQFModalFades(bpy.types.Operator):
                     data['fade_in'] = int(fade_in / fade_over_percent)
                     data['fade_out'] = int(fade_out / fade_over_percent)
 
-        area.tag_redraw()
+        vseqf.redraw_area(area)
 
         if event.type in {'LEFTMOUSE', 'RET'}:
             bpy.ops.ed.undo_push()
@@ -706,9 +836,9 @@ class VSEQFModalFades(bpy.types.Operator):
 
         #Store strip data for quick access, and to prevent it from being overwritten
         self.strip_data = []
-        self.snap_edges = [context.scene.frame_current]
+        self.snap_edges = list(timeline.get_strip_edges(context))
+        bisect.insort(self.snap_edges, context.scene.frame_current)
         for strip in context.strips:
-            self.snap_edges.extend([strip.left_handle, strip.right_handle])
             if strip.select:
                 fade_curve = get_fade_curve(context, strip, create=True)
 
@@ -730,8 +860,6 @@ class VSEQFModalFades(bpy.types.Operator):
                 }
                 self.strip_data.append(data)
 
-        self.snap_edges = list(set(self.snap_edges))  #Sort and remove doubles
-
         #Stores the current position of the mouse
         self.mouse_last_x = event.mouse_x
         self.mouse_last_y = event.mouse_y
@@ -1054,8 +1182,6 @@ class VSEQFQuickFadesCross(bpy.types.Operator):
         return properties.tooltip
 
     def execute(self, context):
-        strips = timeline.current_strips(context)
-
         #store a list of selected strips since adding a crossfade destroys the selection
         selected_strips = timeline.current_selected(context)
         active_strip = timeline.current_active(context)
@@ -1069,19 +1195,19 @@ class VSEQFQuickFadesCross(bpy.types.Operator):
                 if self.type == 'nextsmart':
                     #Need to find next strip
                     first_strip = strip
-                    second_strip = timeline.find_close_strip(strips, first_strip, 'next', mode='all')
+                    second_strip = timeline.find_close_strip(None, first_strip, 'next', mode='all')
                 elif self.type == 'previoussmart':
                     #Need to find previous strip
                     second_strip = strip
-                    first_strip = timeline.find_close_strip(strips, second_strip, 'previous', mode='all')
+                    first_strip = timeline.find_close_strip(None, second_strip, 'previous', mode='all')
                 elif self.type == 'next':
                     #Need to find next strip
                     first_strip = strip
-                    second_strip = timeline.find_close_strip(strips, first_strip, 'next', mode='all')
+                    second_strip = timeline.find_close_strip(None, first_strip, 'next', mode='all')
                 elif self.type == 'previous':
                     #Need to find previous strip
                     second_strip = strip
-                    first_strip = timeline.find_close_strip(strips, second_strip, 'previous', mode='all')
+                    first_strip = timeline.find_close_strip(None, second_strip, 'previous', mode='all')
                 if (second_strip is not None) & (first_strip is not None):
                     if 'smart' in self.type:
                         #adjust start and end frames of strips based on right_handle_offset/start to overlap by amount of crossfade
@@ -1117,7 +1243,8 @@ class VSEQFQuickFadesCross(bpy.types.Operator):
                             #detected overlap is larger than target fade, subtract equal amounts from each strip
                             first_strip.right_handle = first_strip.right_handle - first_strip_offset
                             second_strip.left_handle = second_strip.left_handle + second_strip_offset
-                    fade_exists = find_crossfade(strips, first_strip, second_strip)
+                        timeline.get_strip_index().update_strips([first_strip, second_strip])
+                    fade_exists = find_crossfade(None, first_strip, second_strip)
                     if not fade_exists:
                         vseqf_crossfade(first_strip, second_strip)
 
@@ -1,9 +1,12 @@
 import bpy
 import os
+import bisect
 from . import vseqf
+from . import profiling
 from . import timeline
 from . import fades
 from . import vu_meter
+from . import markers
 
 
 marker_area_height = 40
@@ -34,19 +37,22 @@ def get_click_mode(context):
     return click_mode
 
 
-def move_strip_position(context, strip, offset_x, offset_y, start_channel, start_content_start, start_left_handle, start_right_handle):
-    #Move a strip by a given offset
+def move_strip_position(context, strip, offset_x, offset_y, start_channel, start_content_start, start_left_handle, start_right_handle, index=None, channel=None):
+    #Move a strip by a given offset, if channel is given, it has already been found to be free
 
-    new_start = start_left_handle + offset_x
-    new_end = start_right_handle + offset_x
-    channel = start_channel + offset_y
-    if channel < 1:
-        channel = 1
-    while timeline.sequencer_area_filled(new_start, new_end, channel, channel, [strip]):
-        channel = channel + 1
+    if index is None:
+        index = timeline.get_strip_index(context)
+    if channel is None:
+        new_start = start_left_handle + offset_x
+        new_end = start_right_handle + offset_x
+        channel = start_channel + offset_y
+        if channel < 1:
+            channel = 1
+        channel = index.find_free_channel(new_start, new_end, channel, [strip.as_pointer()])
 
     strip.channel = channel
     strip.content_start = start_content_start + offset_x
+    index.update(strip)
 
 
 def move_strip_left_handle(context, strip, offset_x, start_channel, start_content_start, start_left_handle, start_right_handle, fix_fades=False, only_fix=False):
@@ -101,10 +107,12 @@ def move_strip_right_handle(context, strip, offset_x, start_channel, start_right
         fades.fix_fade_out(context, strip, start_right_handle)
 
 
-def move_strip(context, strip, offset_x, offset_y, select_left, select_right, start_channel, start_content_start, start_left_handle, start_right_handle, ripple=False, fix_fades=False, only_fix=False):
+def move_strip(context, strip, offset_x, offset_y, select_left, select_right, start_channel, start_content_start, start_left_handle, start_right_handle, ripple=False, fix_fades=False, only_fix=False, index=None):
+    if index is None:
+        index = timeline.get_strip_index(context)
     if not select_left and not select_right and not only_fix:  #Move strip
         #check this first for efficiency since probably the most strips will be only middle-selected
-        move_strip_position(context, strip, offset_x, offset_y, start_channel, start_content_start, start_left_handle, start_right_handle)
+        move_strip_position(context, strip, offset_x, offset_y, start_channel, start_content_start, start_left_handle, start_right_handle, index=index)
         return
 
     new_channel = start_channel + offset_y
@@ -112,8 +120,7 @@ def move_strip(context, strip, offset_x, offset_y, select_left, select_right, st
         #make strips that are having the handles adjusted behave better
         new_start = strip.left_handle
         new_end = strip.right_handle
-        while timeline.sequencer_area_filled(new_start, new_end, new_channel, new_channel, [strip]):
-            new_channel = new_channel + 1
+        new_channel = index.find_free_channel(new_start, new_end, new_channel, [strip.as_pointer()])
     if new_channel != strip.channel:
         old_content_start = strip.content_start
         strip.channel = new_channel
@@ -125,6 +132,7 @@ def move_strip(context, strip, offset_x, offset_y, select_left, select_right, st
         move_strip_left_handle(context, strip, offset_x, new_channel, start_content_start, start_left_handle, start_right_handle, fix_fades=fix_fades, only_fix=only_fix)
     if select_right:  #Move right handle
         move_strip_right_handle(context, strip, offset_x, new_channel, start_right_handle, fix_fades=fix_fades, only_fix=only_fix)
+    index.update(strip)
 
 
 def copy_strip(strip):
@@ -149,14 +157,32 @@ def grab_starting_data(strips):
     return data
 
 
-def move_strips(context, starting_data, offset_x, offset_y, grabbed_strips, fix_fades=False, ripple=False, ripple_pop=False, move_root=True, child_edges=False):
+def move_strips(context, starting_data, offset_x, offset_y, grabbed_strips, fix_fades=False, ripple=False, ripple_pop=False, move_root=True, child_edges=False, index=None):
     ripple_offset = 0
     right_edges = []
+    if index is None:
+        index = timeline.get_strip_index(context)
+
+    #Find free positions for all strips that are moved as a whole before moving any, so they can not block each other
+    placed = set()
+    if move_root:
+        to_place = []
+        for strip in grabbed_strips:
+            data = starting_data[strip.name]
+            if not data.select_left_handle and not data.select_right_handle:
+                to_place.append([strip, data.left_handle + offset_x, data.right_handle + offset_x, max(1, data.channel + offset_y)])
+        channels = index.place_strips(to_place)
+        moves = [[placement[0], channel] for placement, channel in zip(to_place, channels)]
+        for strip, channel in sort_by_travel(moves, offset_x, offset_y):
+            data = starting_data[strip.name]
+            move_strip_position(context, strip, offset_x, offset_y, data.channel, data.content_start, data.left_handle, data.right_handle, index=index, channel=channel)
+            placed.add(strip.as_pointer())
 
     #Adjust grabbed strips
     for strip in grabbed_strips:
         data = starting_data[strip.name]
-        move_strip(context, strip, offset_x, offset_y, data.select_left_handle, data.select_right_handle, data.channel, data.content_start, data.left_handle, data.right_handle, ripple=ripple, fix_fades=fix_fades, only_fix=not move_root)
+        if strip.as_pointer() not in placed:
+            move_strip(context, strip, offset_x, offset_y, data.select_left_handle, data.select_right_handle, data.channel, data.content_start, data.left_handle, data.right_handle, ripple=ripple, fix_fades=fix_fades, only_fix=not move_root, index=index)
         right_edges.append(strip.right_handle)
 
         if ripple:
@@ -178,6 +204,21 @@ def move_strips(context, starting_data, offset_x, offset_y, grabbed_strips, fix_
     return ripple_offset
 
 
+def sort_by_travel(moves, offset_x, offset_y):
+    """Orders a list of strip moves so the strips furthest along the direction of travel are moved first, this way a
+    strip is never moved on top of one that has not been moved out of the way yet.
+    Arguments:
+        moves: List of lists, each starting with the strip being moved
+        offset_x: Frames the strips are being moved by
+        offset_y: Channels the strips are being moved by
+
+    Returns: A new sorted list of moves"""
+
+    if offset_x != 0:
+        return sorted(moves, key=lambda move: move[0].left_handle, reverse=offset_x > 0)
+    return sorted(moves, key=lambda move: move[0].channel, reverse=offset_y > 0)
+
+
 def grab_ripple_markers(ripple_markers, ripple, ripple_offset):
     for marker_data in ripple_markers:
         marker, original_frame = marker_data
@@ -187,63 +228,168 @@ def grab_ripple_markers(ripple_markers, ripple, ripple_offset):
             marker.frame = original_frame
 
 
-def grab_ripple_strips(starting_data, ripple_strips, ripple, ripple_offset):
-    for strip in ripple_strips:
-        data = starting_data[strip.name]
-        if ripple:
+def grab_ripple_strips(starting_data, ripple_strips, ripple, ripple_offset, index=None):
+    if index is None:
+        index = timeline.get_strip_index()
+    if ripple:
+        to_place = []
+        for strip in ripple_strips:
+            data = starting_data[strip.name]
             data.rippled = True
-            new_channel = data.channel
-            while timeline.sequencer_area_filled(data.left_handle + ripple_offset, data.right_handle + ripple_offset, new_channel, new_channel, [strip]):
-                new_channel = new_channel + 1
-            strip.channel = new_channel
+            to_place.append([strip, data.left_handle + ripple_offset, data.right_handle + ripple_offset, data.channel])
+        channels = index.place_strips(to_place)
+        moves = [[placement[0], channel] for placement, channel in zip(to_place, channels)]
+        for strip, channel in sort_by_travel(moves, ripple_offset, 0):
+            data = starting_data[strip.name]
+            strip.channel = channel
             strip.content_start = data.content_start + ripple_offset
-
-        if data.rippled and not ripple:
-            #fix strip locations when ripple is disabled
-            new_channel = data.channel
-            new_start = data.left_handle
-            new_end = data.right_handle
-            while timeline.sequencer_area_filled(new_start, new_end, new_channel, new_channel, [strip]):
-                new_channel = new_channel + 1
-            strip.channel = new_channel
+            index.update(strip)
+    else:
+        #fix strip locations when ripple is disabled
+        to_place = []
+        for strip in ripple_strips:
+            data = starting_data[strip.name]
+            if data.rippled:
+                to_place.append([strip, data.left_handle, data.right_handle, data.channel])
+        if not to_place:
+            return
+        channels = index.place_strips(to_place)
+        moves = [[placement[0], channel] for placement, channel in zip(to_place, channels)]
+        offset = to_place[0][1] - to_place[0][0].left_handle
+        for strip, channel in sort_by_travel(moves, offset, 0):
+            data = starting_data[strip.name]
+            strip.channel = channel
             strip.content_start = data.content_start
+            index.update(strip)
             if strip.content_start == data.content_start and strip.channel == data.channel:
                 #unfortunately, there seems to be a limitation in blender preventing me from putting the strip back where it should be... keep trying until the grabbed strips are out of the way.
                 data.rippled = False
 
 
-def ripple_timeline(sequencer, strips, start_frame, ripple_amount, select_ripple=True, markers=[]):
+def ripple_timeline(sequencer, strips, start_frame, ripple_amount, select_ripple=True, move_markers=False, index=None):
     """Moves all given strips starting after the frame given as 'start_frame', by moving them forward by 'ripple_amount' frames.
-    'select_ripple' will select all strips that were moved."""
-
-    to_change = []
-    for strip in strips:
-        if not timeline.is_locked(sequencer, strip) and strip.right_handle > start_frame - ripple_amount and strip.left_handle > start_frame:
-            to_change.append([strip, strip.channel, strip.content_start + ripple_amount, True])
-    for seq in to_change:
-        strip = seq[0]
-        strip.channel = seq[1]
+    New positions are found for every strip before any are moved, then strips are moved in their direction of travel
+    so none are ever placed on top of a strip that has not been moved yet.
+    Arguments:
+        sequencer: the current SequenceEditor
+        strips: List of strips to ripple, if None, all strips in the current timeline are used
+        start_frame: Integer, only strips starting after this frame are moved
+        ripple_amount: Integer, number of frames to move the strips, negative to move them backwards
+        select_ripple: Boolean, if True, all strips that were moved will be selected
+        move_markers: Boolean, if True, markers after the start frame are moved as well
+        index: StripIndex to use, defaults to the index of the current timeline
+
+    Returns: Integer, the number of strips moved"""
+
+    if index is None:
+        index = timeline.get_strip_index()
+    if strips is None:
+        geometry = timeline.get_strip_geometry()
+        to_ripple = []
+        for row, strip in enumerate(geometry.strips):
+            if geometry.lefts[row] > start_frame and geometry.rights[row] > start_frame - ripple_amount and not geometry.is_locked(row):
+                to_ripple.append(strip)
+    else:
+        to_ripple = []
+        for strip in strips:
+            if not timeline.is_locked(sequencer, strip) and strip.right_handle > start_frame - ripple_amount and strip.left_handle > start_frame:
+                to_ripple.append(strip)
+
+    moved = move_ripple_strips([[strip, ripple_amount] for strip in to_ripple], ripple_amount, select_ripple=select_ripple, index=index)
+    if move_markers:
+        markers.ripple_markers(bpy.context.scene, start_frame - ripple_amount, ripple_amount)
+    return moved
+
+
+def ripple_gaps(gaps, select_ripple=True, move_markers=False, index=None):
+    """Closes a set of gaps in the current timeline in one pass, each strip after a gap is moved back by the total
+    length of all the gaps before it.  Which gaps a strip or marker follows is decided by its position before any of
+    the gaps are closed, using the same tests as ripple_timeline().
+    Arguments:
+        gaps: List of [start, end] frame ranges, sorted and not overlapping, as given by timeline.merge_intervals()
+        select_ripple: Boolean, if True, all strips that were moved will be selected
+        move_markers: Boolean, if True, markers after each gap are moved as well
+        index: StripIndex to use, defaults to the index of the current timeline
+
+    Returns: Integer, the number of strips moved"""
+
+    if not gaps:
+        return 0
+    if index is None:
+        index = timeline.get_strip_index()
+    starts = [gap[0] for gap in gaps]
+    ends = [gap[1] for gap in gaps]
+    totals = [0]  #total length of the first n gaps
+    for start, end in gaps:
+        totals.append(totals[-1] + end - start)
+
+    geometry = timeline.get_strip_geometry()
+    to_ripple = []
+    for row, strip in enumerate(geometry.strips):
+        #a strip is moved by each gap that it starts after and ends after
+        gap_count = min(bisect.bisect_left(starts, geometry.lefts[row]), bisect.bisect_left(ends, geometry.rights[row]))
+        if gap_count and not geometry.is_locked(row):
+            to_ripple.append([strip, -totals[gap_count]])
+    moved = move_ripple_strips(to_ripple, -1, select_ripple=select_ripple, index=index)
+    if move_markers:
+        markers.close_marker_gaps(bpy.context.scene, ends, totals)
+    return moved
+
+
+def move_ripple_strips(to_ripple, direction, select_ripple=True, index=None):
+    """Moves a group of strips by their own offsets in a single pass
+    Arguments:
+        to_ripple: List of [strip, offset] pairs, offset is the number of frames to move the strip
+        direction: Integer, positive if the strips are moving forward, negative if backward
+        select_ripple: Boolean, if True, all strips that were moved will be selected
+        index: StripIndex to use, defaults to the index of the current timeline
+
+    Returns: Integer, the number of strips moved, not counting effect strips that follow them"""
+
+    if index is None:
+        index = timeline.get_strip_index()
+    to_place = []
+    moves = []
+    for strip, offset in to_ripple:
         if not hasattr(strip, 'input_1'):
-            strip.content_start = seq[2]
-        if select_ripple:
+            #effect strips will follow the strips they are applied to
+            to_place.append([strip, strip.left_handle + offset, strip.right_handle + offset, strip.channel])
+            moves.append([strip, strip.content_start + offset])
+    channels = index.place_strips(to_place)
+    for move, channel in zip(moves, channels):
+        move.append(channel)
+    for strip, content_start, channel in sort_by_travel(moves, direction, 0):
+        set_strip_position(strip, channel, content_start, index)
+    if select_ripple:
+        for strip, offset in to_ripple:
             strip.select = True
-        if (strip.content_start != seq[2] or strip.channel != seq[1]) and seq[3]:
-            seq[3] = False
-            to_change.append(seq)
-    if markers:
-        for marker in markers:
-            if marker.frame >= (start_frame - ripple_amount):
-                marker.frame = marker.frame + ripple_amount
+    return len(moves)
+
+
+def set_strip_position(strip, channel, content_start, index):
+    """Moves a strip to a new channel and content_start, changing the channel first only if the strip will not be
+    placed over another strip in the new channel at its old position
+    Arguments:
+        strip: VSE Strip to move
+        channel: Integer, new channel for the strip
+        content_start: Integer, new content_start for the strip
+        index: StripIndex used to check the new channel, updated once the strip is moved"""
+
+    if strip.channel != channel and index.channel_filled(channel, strip.left_handle, strip.right_handle, [strip.as_pointer()]):
+        strip.content_start = content_start
+        strip.channel = channel
+    else:
+        strip.channel = channel
+        strip.content_start = content_start
+    index.update(strip)
 
 
 def near_marker(context, frame, distance=None):
     if distance is None:
         distance = marker_grab_distance
-    if context.scene.timeline_markers:
-        markers = sorted(context.scene.timeline_markers, key=lambda x: abs(x.frame - frame))
-        marker = markers[0]
-        if abs(marker.frame - frame) <= distance:
-            return marker
+    marker = markers.find_marker(context.scene, frame, 'closest')
+    if marker is not None and abs(marker.frame - frame) <= distance:
+        return marker
     return None
 
 
@@ -437,7 +583,11 @@ class VSEQFGrabAdd(bpy.types.Operator):
     timeline_height = 1
     ripple_start = 0
     ripple_left = 0
+    strip_index = None
+    index_strips = []
 
+    @profiling.profiled
+    @vseqf.draw_batched
     def vseqf_grab_draw(self, context):
         #Callback function to draw overlays in sequencer when grab is activated
         colors = context.preferences.themes[0].user_interface
@@ -484,6 +634,7 @@ class VSEQFGrabAdd(bpy.types.Operator):
                 strip.content_start = data.content_start
             else:
                 strip.channel = data.channel
+        self.strip_index.update_strips(self.strips)
 
     def modal(self, context, event):
         release_confirm = bpy.context.preferences.inputs.use_drag_immediately
@@ -551,10 +702,12 @@ class VSEQFGrabAdd(bpy.types.Operator):
         else:
             offset_y = pos_y - self.target_grab_channel
 
+        #the built-in grab operator has moved the selected strips since the last event
+        self.strip_index.update_strips(self.index_strips)
         if reset_strips:
             self.reset_strips()
-        ripple_offset = move_strips(context, self.starting_data, offset_x, offset_y, self.grabbed_strips, ripple_pop=self.ripple_pop, fix_fades=False, ripple=self.ripple, move_root=False)
-        grab_ripple_strips(self.starting_data, self.ripple_strips, self.ripple, ripple_offset)
+        ripple_offset = move_strips(context, self.starting_data, offset_x, offset_y, self.grabbed_strips, ripple_pop=self.ripple_pop, fix_fades=False, ripple=self.ripple, move_root=False, index=self.strip_index)
+        grab_ripple_strips(self.starting_data, self.ripple_strips, self.ripple, ripple_offset, index=self.strip_index)
         if context.scene.vseqf.ripple_markers:
             grab_ripple_markers(self.ripple_markers, self.ripple, ripple_offset)
 
@@ -587,8 +740,8 @@ class VSEQFGrabAdd(bpy.types.Operator):
                 fix_fades = True
             else:
                 fix_fades = False
-            ripple_offset = move_strips(context, self.starting_data, offset_x, offset_y, self.grabbed_strips, ripple_pop=self.ripple_pop, fix_fades=fix_fades, ripple=self.ripple, move_root=False)
-            grab_ripple_strips(self.starting_data, self.ripple_strips, self.ripple, ripple_offset)
+            ripple_offset = move_strips(context, self.starting_data, offset_x, offset_y, self.grabbed_strips, ripple_pop=self.ripple_pop, fix_fades=fix_fades, ripple=self.ripple, move_root=False, index=self.strip_index)
+            grab_ripple_strips(self.starting_data, self.ripple_strips, self.ripple, ripple_offset, index=self.strip_index)
             if context.scene.vseqf.ripple_markers:
                 grab_ripple_markers(self.ripple_markers, self.ripple, ripple_offset)
 
@@ -619,11 +772,12 @@ class VSEQFGrabAdd(bpy.types.Operator):
         self.strips = []
         self.grabbed_strips = []
         self.ripple_strips = []
-        strips = timeline.current_strips(context)
-        self.timeline_start = timeline.find_strips_start(strips)
-        self.timeline_end = timeline.find_strips_end(strips)
+        geometry = timeline.get_strip_geometry(context)
+        strips = list(timeline.current_strips(context))
+        self.timeline_start = timeline.find_strips_start()
+        self.timeline_end = timeline.find_strips_end()
         self.ripple_start = self.timeline_end
-        self.timeline_height = timeline.find_timeline_height(strips)
+        self.timeline_height = timeline.find_timeline_height()
         to_move = []
         selected_strips = timeline.current_selected(context)
         for strip in selected_strips:
@@ -643,14 +797,23 @@ class VSEQFGrabAdd(bpy.types.Operator):
                 self.ripple_markers.append([marker, marker.frame])
 
         self.starting_data = grab_starting_data(strips)
+        self.strip_index = timeline.StripIndex(strips)
+        self.index_strips = []
         #generate grabbed strips and ripple strips lists
         for strip in strips:
-            if not timeline.is_locked(sequencer, strip) and not hasattr(strip, 'input_1'):
+            row = geometry.rows.get(strip.as_pointer())
+            if row is None:
+                continue
+            is_effect = geometry.effects[row]
+            if is_effect or strip.select:
+                #strips that the built-in grab operator may move
+                self.index_strips.append(strip)
+            if not is_effect and not geometry.is_locked(row):
                 self.strips.append(strip)
                 if strip.select:
                     self.grabbed_strips.append(strip)
                 else:
-                    if strip.left_handle >= self.ripple_start:
+                    if geometry.lefts[row] >= self.ripple_start:
                         self.ripple_strips.append(strip)
         self._timer = context.window_manager.event_timer_add(time_step=0.01, window=context.window)
         self.ripple_strips.sort(key=lambda x: x.left_handle)
@@ -847,10 +1010,7 @@ class VSEQFContextMarker(bpy.types.Menu):
             layout.operator('vseqf.meta_exit')
             layout.separator()
         frame = context.scene.vseqf.current_marker_frame
-        marker = None
-        for timeline_marker in context.scene.timeline_markers:
-            if timeline_marker.frame == frame:
-                marker = timeline_marker
+        marker = markers.find_marker(context.scene, frame, 'at')
         if marker:
             layout.operator('vseqf.quickmarkers_delete', text='Delete Marker').frame = frame
             row = layout.row()
@@ -0,0 +1,383 @@
+import bpy
+import math
+import time
+import numpy
+from . import vseqf
+from . import fades
+from . import timeline
+from . import vu_meter
+
+loudness_block_seconds = 1  #Length of the mix read and measured at once
+absolute_gate = -70  #LUFS, blocks quieter than this are ignored by the integrated loudness
+relative_gate = -10  #LU, blocks this much quieter than the ungated loudness are ignored by the integrated loudness
+true_peak_taps = 48  #Length of the interpolation filter used for true peak measurement
+
+#channel counts and BS.1770 channel weights for the scene audio channel settings, in the aud channel order
+channel_layouts = {
+    'MONO': [1.0],
+    'STEREO': [1.0, 1.0],
+    'SURROUND4': [1.0, 1.0, 1.41, 1.41],
+    'SURROUND51': [1.0, 1.0, 1.0, 0.0, 1.41, 1.41],
+    'SURROUND71': [1.0, 1.0, 1.0, 0.0, 1.41, 1.41, 1.41, 1.41]
+}
+
+
+def k_weighting_coefficients(rate):
+    """Finds the BS.1770 K-weighting filter coefficients for a sample rate
+    Arguments:
+        rate: Integer, sample rate
+
+    Returns: List of two (b, a) coefficient pairs, the high shelf stage and the high pass stage"""
+
+    frequency = 1681.974450955533
+    gain = 3.999843853973347
+    q = 0.7071752369554196
+    k = math.tan(math.pi * frequency / rate)
+    vh = math.pow(10.0, gain / 20.0)
+    vb = math.pow(vh, 0.4996667741545416)
+    a0 = 1.0 + k / q + k * k
+    shelf_b = [(vh + vb * k / q + k * k) / a0, 2.0 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0]
+    shelf_a = [1.0, 2.0 * (k * k - 1.0) / a0, (1.0 - k / q + k * k) / a0]
+
+    frequency = 38.13547087602444
+    q = 0.5003270373238773
+    k = math.tan(math.pi * frequency / rate)
+    a0 = 1.0 + k / q + k * k
+    highpass_b = [1.0, -2.0, 1.0]
+    highpass_a = [1.0, 2.0 * (k * k - 1.0) / a0, (1.0 - k / q + k * k) / a0]
+    return [(shelf_b, shelf_a), (highpass_b, highpass_a)]
+
+
+def impulse_response(stages, length):
+    """Finds the impulse response of a chain of biquad filters by running an impulse through them
+    Arguments:
+        stages: List of (b, a) coefficient pairs
+        length: Integer, number of samples of the response to find
+
+    Returns: numpy array"""
+
+    response = [0.0] * length
+    response[0] = 1.0
+    for b, a in stages:
+        x1 = x2 = y1 = y2 = 0.0
+        for index in range(length):
+            x = response[index]
+            y = b[0] * x + b[1] * x1 + b[2] * x2 - a[1] * y1 - a[2] * y2
+            x2 = x1
+            x1 = x
+            y2 = y1
+            y1 = y
+            response[index] = y
+    return numpy.array(response)
+
+
+class KWeightingFilter(object):
+    """Applies the K-weighting filter to blocks of samples.  The filter is run as a long FIR approximation of its
+    impulse response using FFT convolution (overlap-save), so each block is filtered with a few numpy calls."""
+
+    def __init__(self, rate, channels, block_length):
+        #the high pass pole decays below 1e-20 well within a quarter second at any sample rate
+        response = impulse_response(k_weighting_coefficients(rate), max(int(rate / 4), 64))
+        self.history = len(response) - 1
+        self.fft_size = 1 << (block_length + self.history - 1).bit_length()
+        self.response = numpy.fft.rfft(response, self.fft_size)[:, numpy.newaxis]
+        self.tail = numpy.zeros((self.history, channels))
+
+    def process(self, block):
+        """Filters a block of samples, continuing from the end of the last block
+        Arguments:
+            block: numpy array of samples, one column per channel, no longer than the block_length
+
+        Returns: numpy array of filtered samples"""
+
+        samples = numpy.concatenate((self.tail, block))
+        filtered = numpy.fft.irfft(numpy.fft.rfft(samples, self.fft_size, axis=0) * self.response, self.fft_size, axis=0)
+        self.tail = samples[len(samples) - self.history:]
+        return filtered[self.history:len(samples)]
+
+
+class TruePeakMeter(object):
+    """Finds the true peak of blocks of samples by oversampling them with a polyphase interpolation filter"""
+
+    def __init__(self, rate, channels):
+        if rate < 96000:
+            self.oversample = 4
+        elif rate < 192000:
+            self.oversample = 2
+        else:
+            self.oversample = 1
+        taps = true_peak_taps
+        positions = (numpy.arange(taps) - (taps - 1) / 2) / self.oversample
+        interpolation = numpy.sinc(positions) * numpy.kaiser(taps, 6)
+        self.phases = [interpolation[phase::self.oversample][::-1] for phase in range(self.oversample)]
+        self.history = len(self.phases[0]) - 1
+        self.tail = numpy.zeros((self.history, channels))
+        self.true_peak = 0.0
+        self.sample_peak = 0.0
+
+    def process(self, block):
+        if len(block) == 0:
+            return
+        self.sample_peak = max(self.sample_peak, float(numpy.abs(block).max()))
+        samples = numpy.concatenate((self.tail, block))
+        self.tail = samples[len(samples) - self.history:]
+        peak = self.true_peak
+        if self.oversample == 1:
+            peak = max(peak, float(numpy.abs(block).max()))
+        else:
+            for channel in range(samples.shape[1]):
+                for phase in self.phases:
+                    interpolated = numpy.convolve(samples[:, channel], phase, mode='valid')
+                    peak = max(peak, float(numpy.abs(interpolated).max()))
+        self.true_peak = peak
+
+
+def power_to_lufs(power):
+    with numpy.errstate(divide='ignore'):
+        return -0.691 + 10 * numpy.log10(power)
+
+
+class LoudnessMeter(object):
+    """Measures BS.1770 loudness and true peak of a stream of sample blocks.  Only the K-weighted power of every 100ms
+    is kept, so any length of audio can be measured."""
+
+    def __init__(self, rate, weights, block_length):
+        self.rate = rate
+        self.weights = numpy.array(weights)
+        self.step = int(round(rate / 10))
+        self.filter = KWeightingFilter(rate, len(weights), block_length)
+        self.true_peak = TruePeakMeter(rate, len(weights))
+        self.pending = numpy.zeros((0, len(weights)))
+        self.powers = []
+
+    def add(self, block):
+        """Measures the next block of samples
+        Arguments:
+            block: numpy array of samples, one column per channel"""
+
+        self.true_peak.process(block)
+        filtered = numpy.concatenate((self.pending, self.filter.process(block)))
+        steps = len(filtered) // self.step
+        if steps:
+            used = steps * self.step
+            squares = numpy.square(filtered[:used]).reshape(steps, self.step, filtered.shape[1]).mean(axis=1)
+            self.powers.extend((squares @ self.weights).tolist())
+            filtered = filtered[used:]
+        self.pending = filtered
+
+    def window_powers(self, length):
+        #Mean power of every window of a number of 100ms steps, ending on each step
+        powers = numpy.array(self.powers)
+        if len(powers) < length:
+            return numpy.zeros(0)
+        totals = numpy.cumsum(numpy.concatenate(([0.0], powers)))
+        return (totals[length:] - totals[:-length]) / length
+
+    def results(self):
+        """Calculates the loudness of everything measured so far
+        Returns: Dictionary of:
+            'integrated': Float, gated integrated loudness in LUFS
+            'momentary_max': Float, highest 400ms loudness in LUFS
+            'short_term_max': Float, highest 3s loudness in LUFS
+            'true_peak': Float, true peak in dBTP
+            'sample_peak': Float, sample peak in dBFS
+            'seconds': List of short term loudness, highest momentary loudness for each second"""
+
+        momentary = self.window_powers(4)
+        short_term = self.window_powers(30)
+        momentary_lufs = power_to_lufs(momentary)
+        short_term_lufs = power_to_lufs(short_term)
+
+        integrated = -math.inf
+        gated = momentary[momentary_lufs > absolute_gate]
+        if len(gated):
+            threshold = power_to_lufs(gated.mean()) + relative_gate
+            gated = gated[power_to_lufs(gated) > threshold]
+            if len(gated):
+                integrated = float(power_to_lufs(gated.mean()))
+
+        seconds = []
+        for second in range(len(self.powers) // 10):
+            last_step = second * 10 + 9
+            if last_step >= 29:
+                second_short_term = float(short_term_lufs[last_step - 29])
+            else:
+                second_short_term = float(power_to_lufs(numpy.mean(self.powers[:last_step + 1])))
+            second_momentary = momentary_lufs[max(second * 10 + 3, 3) - 3:last_step - 2]
+            if len(second_momentary):
+                seconds.append([second_short_term, float(second_momentary.max())])
+            else:
+                seconds.append([second_short_term, -math.inf])
+
+        with numpy.errstate(divide='ignore'):
+            true_peak = float(20 * numpy.log10(self.true_peak.true_peak))
+            sample_peak = float(20 * numpy.log10(self.true_peak.sample_peak))
+        return {
+            'integrated': integrated,
+            'momentary_max': float(momentary_lufs.max()) if len(momentary_lufs) else -math.inf,
+            'short_term_max': float(short_term_lufs.max()) if len(short_term_lufs) else -math.inf,
+            'true_peak': true_peak,
+            'sample_peak': sample_peak,
+            'seconds': seconds
+        }
+
+
+class MixdownReader(object):
+    """Reads the mix of all unmuted sound strips in a frame range, one block of samples at a time.
+    Strip volume and volume fade curves are applied, strip pan, pitch and speed are not."""
+
+    def __init__(self, context, start, end, rate, channels):
+        scene = context.scene
+        self.rate = rate
+        self.channels = channels
+        self.fps = vseqf.get_fps(scene)
+        self.start = start
+        self.length = int(round((end + 1 - start) / self.fps * rate))
+        self.volume = scene.audio_volume
+        self.strips = []
+        sequence_editor = scene.sequence_editor
+        if sequence_editor is None:
+            return
+        depsgraph = context.evaluated_depsgraph_get()
+        for strip in sequence_editor.strips_all:
+            if strip.type != 'SOUND' or strip.sound is None or timeline.is_muted(sequence_editor, strip):
+                continue
+            if strip.right_handle <= start or strip.left_handle > end:
+                continue
+            factory = strip.sound.evaluated_get(depsgraph).factory
+            if factory.specs[0] != rate:
+                factory = factory.resample(rate, True)
+            if factory.specs[1] != channels:
+                factory = factory.rechannel(channels)
+            self.strips.append({
+                'factory': factory,
+                'first': self.frame_to_sample(strip.left_handle),
+                'last': self.frame_to_sample(strip.right_handle),
+                'offset': (start - strip.content_start) / self.fps,
+                'fcurve': fades.fade_cache.get_fade_curve(context, strip),
+                'volume': strip.volume
+            })
+
+    def frame_to_sample(self, frame):
+        return int(math.ceil((frame - self.start) / self.fps * self.rate))
+
+    def read(self, first, count):
+        """Mixes a block of samples
+        Arguments:
+            first: Integer, first sample to read, counted from the start frame
+            count: Integer, number of samples to read
+
+        Returns: numpy array of samples, one column per channel"""
+
+        mix = numpy.zeros((count, self.channels))
+        for strip in self.strips:
+            block_first = max(first, strip['first'])
+            block_last = min(first + count, strip['last'])
+            if block_last <= block_first:
+                continue
+            time_from = max(strip['offset'] + block_first / self.rate, 0)
+            time_to = strip['offset'] + block_last / self.rate
+            data = strip['factory'].limit(time_from, time_to).data()
+            samples = min(len(data), block_last - block_first)
+            if samples <= 0:
+                continue
+            data = data[:samples].reshape(samples, -1)
+            fcurve = strip['fcurve']
+            if fcurve:
+                sample_frames = self.start + (numpy.arange(block_first, block_first + samples) / self.rate * self.fps)
+                curve_frames = numpy.arange(math.floor(sample_frames[0]), math.ceil(sample_frames[-1]) + 1)
+                gains = numpy.interp(sample_frames, curve_frames, vu_meter.curve_values(fcurve, curve_frames))[:, numpy.newaxis]
+            else:
+                gains = strip['volume']
+            mix[block_first - first:block_first - first + samples] += data * gains
+        if self.volume != 1:
+            mix = mix * self.volume
+        return mix
+
+
+def format_lufs(value, unit):
+    if not math.isfinite(value):
+        return '-inf '+unit
+    return format(value, '.1f')+' '+unit
+
+
+def loudness_report(results, scene, start, end):
+    """Formats the results of a LoudnessMeter as text
+    Returns: String"""
+
+    fps = vseqf.get_fps(scene)
+    lines = [
+        'Loudness of frames '+str(start)+' to '+str(end)+' (ITU-R BS.1770)',
+        '',
+        'Integrated:          '+format_lufs(results['integrated'], 'LUFS'),
+        'Short-term maximum:  '+format_lufs(results['short_term_max'], 'LUFS'),
+        'Momentary maximum:   '+format_lufs(results['momentary_max'], 'LUFS'),
+        'True peak:           '+format_lufs(results['true_peak'], 'dBTP'),
+        'Sample peak:         '+format_lufs(results['sample_peak'], 'dBFS'),
+        '',
+        'Per second loudness:',
+        '{:<16}{:>20}{:>20}'.format('Time', 'Short-term', 'Momentary max')
+    ]
+    for second, levels in enumerate(results['seconds']):
+        timecode = vseqf.timecode_from_frames(start + second * fps, fps, levels=3, subsecond_type='frames')
+        lines.append('{:<16}{:>20}{:>20}'.format(timecode, format_lufs(levels[0], 'LUFS'), format_lufs(levels[1], 'LUFS')))
+    return '\n'.join(lines)
+
+
+class VSEQFLoudnessReport(bpy.types.Operator):
+    """Measures integrated, short-term and momentary loudness and true peak of the scene range, the results are saved
+    to the 'Loudness Report' text"""
+    bl_idname = 'vseqf.loudness_report'
+    bl_label = 'Measure Loudness'
+
+    start = 0
+    end = 0
+    position = 0
+    block_length = 0
+    reader = None
+    meter = None
+
+    def execute(self, context):
+        scene = context.scene
+        self.start = scene.frame_start
+        self.end = scene.frame_end
+        ffmpeg = scene.render.ffmpeg
+        rate = int(ffmpeg.audio_mixrate)
+        weights = channel_layouts.get(ffmpeg.audio_channels, channel_layouts['STEREO'])
+        self.block_length = int(rate * loudness_block_seconds)
+        self.reader = MixdownReader(context, self.start, self.end, rate, len(weights))
+        self.meter = LoudnessMeter(rate, weights, self.block_length)
+        self.position = 0
+        self._timer = context.window_manager.event_timer_add(time_step=0.01, window=context.window)
+        context.window_manager.modal_handler_add(self)
+        context.window_manager.progress_begin(0, 100)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type in {'RIGHTMOUSE', 'ESC'}:
+            self.end_modal(context)
+            return {'CANCELLED'}
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        #measure blocks for a short time each timer event so the interface can still update
+        started = time.perf_counter()
+        while self.position < self.reader.length and time.perf_counter() - started < 0.1:
+            count = min(self.block_length, self.reader.length - self.position)
+            self.meter.add(self.reader.read(self.position, count))
+            self.position = self.position + count
+        if self.reader.length:
+            context.window_manager.progress_update(self.position / self.reader.length * 100)
+        if self.position >= self.reader.length:
+            self.end_modal(context)
+            report = loudness_report(self.meter.results(), context.scene, self.start, self.end)
+            vu_meter.display_report(report, name='Loudness Report')
+            self.report({'INFO'}, "Loudness report saved, check 'Loudness Report' in the text editor")
+            return {'FINISHED'}
+        return {'RUNNING_MODAL'}
+
+    def end_modal(self, context):
+        context.window_manager.progress_end()
+        context.window_manager.event_timer_remove(self._timer)
+        self.reader = None
+        self.meter = None
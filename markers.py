@@ -1,5 +1,217 @@
 import bpy
+import bisect
 from . import vseqf
+from . import timeline
+
+
+marker_index = None
+marker_index_changed = True  #markers may have been changed outside of this addon, index needs to be rebuilt
+msgbus_owner = object()
+
+
+class MarkerIndex(object):
+    """Frame sorted index of the timeline markers in a scene.
+    Markers are stored by their position in the timeline_markers collection instead of by reference, so a marker
+    returned from the index is always looked up fresh from the collection.  Operators in this addon patch the index as
+    they change markers, other changes are picked up by handlers calling marker_index_tag_changed()."""
+
+    def __init__(self, frames=None, key=None):
+        self.key = key
+        self.collection_frames = []  #marker frames in collection order
+        self.frames = []  #marker frames in sorted order
+        self.order = []  #collection positions of markers in sorted order
+        if frames is not None:
+            self.rebuild(frames)
+
+    def __len__(self):
+        return len(self.collection_frames)
+
+    def rebuild(self, frames):
+        self.collection_frames = list(frames)
+        self.order = sorted(range(len(self.collection_frames)), key=lambda position: (self.collection_frames[position], position))
+        self.frames = [self.collection_frames[position] for position in self.order]
+
+    def insert_sorted(self, position):
+        frame = self.collection_frames[position]
+        sorted_position = bisect.bisect_right(self.frames, frame)
+        #keep markers on the same frame in collection order
+        while sorted_position > 0 and self.frames[sorted_position - 1] == frame and self.order[sorted_position - 1] > position:
+            sorted_position = sorted_position - 1
+        self.frames.insert(sorted_position, frame)
+        self.order.insert(sorted_position, position)
+
+    def remove_sorted(self, position):
+        frame = self.collection_frames[position]
+        start = bisect.bisect_left(self.frames, frame)
+        end = bisect.bisect_right(self.frames, frame)
+        for sorted_position in range(start, end):
+            if self.order[sorted_position] == position:
+                del self.frames[sorted_position]
+                del self.order[sorted_position]
+                return
+
+    def add(self, frame):
+        """Call after a new marker has been added to the end of the collection"""
+        self.collection_frames.append(frame)
+        self.insert_sorted(len(self.collection_frames) - 1)
+
+    def remove(self, position):
+        """Call after the marker at the given collection position has been removed"""
+        self.remove_sorted(position)
+        del self.collection_frames[position]
+        self.order = [index - 1 if index > position else index for index in self.order]
+
+    def move(self, position, frame):
+        """Call after the marker at the given collection position has been moved to a new frame"""
+        self.remove_sorted(position)
+        self.collection_frames[position] = frame
+        self.insert_sorted(position)
+
+    def first_on_frame(self, sorted_position):
+        #returns the sorted position of the first marker on the same frame as the given sorted position
+        return bisect.bisect_left(self.frames, self.frames[sorted_position])
+
+    def next(self, frame):
+        """Returns the collection position of the closest marker after the frame, or None"""
+        sorted_position = bisect.bisect_right(self.frames, frame)
+        if sorted_position < len(self.frames):
+            return self.order[sorted_position]
+        return None
+
+    def previous(self, frame):
+        """Returns the collection position of the closest marker before the frame, or None"""
+        sorted_position = bisect.bisect_left(self.frames, frame) - 1
+        if sorted_position >= 0:
+            return self.order[self.first_on_frame(sorted_position)]
+        return None
+
+    def closest(self, frame):
+        """Returns the collection position of the closest marker to the frame, or None if there are no markers.
+        If two markers are the same distance away, the first one in the collection is returned."""
+        sorted_position = bisect.bisect_left(self.frames, frame)
+        candidates = []
+        if sorted_position < len(self.frames):
+            candidates.append((self.frames[sorted_position] - frame, self.order[sorted_position]))
+        if sorted_position > 0:
+            before = self.first_on_frame(sorted_position - 1)
+            candidates.append((frame - self.frames[before], self.order[before]))
+        if candidates:
+            return min(candidates)[1]
+        return None
+
+    def at_frame(self, frame):
+        """Returns the collection position of the first marker on the frame, or None"""
+        sorted_position = bisect.bisect_left(self.frames, frame)
+        if sorted_position < len(self.frames) and self.frames[sorted_position] == frame:
+            return self.order[sorted_position]
+        return None
+
+    def sort_order(self):
+        """Returns a list giving the sorted position of each marker in collection order, as used by UIList"""
+        new_order = [0] * len(self.order)
+        for sorted_position, position in enumerate(self.order):
+            new_order[position] = sorted_position
+        return new_order
+
+
+def marker_index_tag_changed(*_):
+    #Called by handlers and msgbus whenever markers may have been changed outside of the index
+    global marker_index_changed
+    marker_index_changed = True
+
+
+def get_marker_index(scene=None):
+    """Returns the MarkerIndex for the given scene, the markers are only read again if they have been tagged as changed
+    Arguments:
+        scene: Scene to index the markers of, defaults to the current scene
+
+    Returns: MarkerIndex"""
+
+    global marker_index
+    global marker_index_changed
+    if scene is None:
+        scene = bpy.context.scene
+    key = scene.as_pointer()
+    if marker_index is None or marker_index_changed or marker_index.key != key or len(marker_index) != len(scene.timeline_markers):
+        marker_index = MarkerIndex(timeline.read_array(scene.timeline_markers, 'frame', 'i'), key)
+        marker_index_changed = False
+    return marker_index
+
+
+def subscribe_marker_changes():
+    """Subscribes to marker frame changes that do not always cause a depsgraph update"""
+    unsubscribe_marker_changes()
+    bpy.msgbus.subscribe_rna(key=(bpy.types.TimelineMarker, 'frame'), owner=msgbus_owner, args=(), notify=marker_index_tag_changed)
+
+
+def unsubscribe_marker_changes():
+    bpy.msgbus.clear_by_owner(msgbus_owner)
+
+
+def ripple_markers(scene, start_frame, ripple_amount):
+    """Moves all markers on or after a frame by the same amount
+    Arguments:
+        scene: Scene to move the markers of
+        start_frame: Integer, markers on or after this frame are moved
+        ripple_amount: Integer, number of frames to move the markers by
+
+    Returns: Integer, the number of markers moved"""
+
+    index = get_marker_index(scene)
+    positions = index.order[bisect.bisect_left(index.frames, start_frame):]
+    timeline_markers = scene.timeline_markers
+    for position in positions:
+        frame = index.collection_frames[position] + ripple_amount
+        timeline_markers[position].frame = frame
+        index.collection_frames[position] = frame
+    if positions:
+        index.rebuild(index.collection_frames)
+    return len(positions)
+
+
+def close_marker_gaps(scene, ends, totals):
+    """Moves markers back to follow strips rippled by grabs.ripple_gaps()
+    Arguments:
+        scene: Scene to move the markers of
+        ends: Sorted list of the end frames of each gap
+        totals: List of the total length of the first n gaps, starting with 0
+
+    Returns: Integer, the number of markers moved"""
+
+    index = get_marker_index(scene)
+    positions = index.order[bisect.bisect_left(index.frames, ends[0]):]
+    timeline_markers = scene.timeline_markers
+    for position in positions:
+        frame = index.collection_frames[position]
+        frame = frame - totals[bisect.bisect_right(ends, frame)]
+        timeline_markers[position].frame = frame
+        index.collection_frames[position] = frame
+    if positions:
+        index.rebuild(index.collection_frames)
+    return len(positions)
+
+
+def find_marker(scene, frame, direction):
+    """Finds a marker relative to a frame using the marker index
+    Arguments:
+        scene: Scene to search the markers of
+        frame: Integer, frame to search from
+        direction: String, 'next', 'previous', 'at' for a marker on the frame, any other value for the closest marker
+
+    Returns: TimelineMarker or None"""
+
+    index = get_marker_index(scene)
+    if direction == 'next':
+        position = index.next(frame)
+    elif direction == 'previous':
+        position = index.previous(frame)
+    elif direction == 'at':
+        position = index.at_frame(frame)
+    else:
+        position = index.closest(frame)
+    if position is None:
+        return None
+    return scene.timeline_markers[position]
 
 
 class VSEQF_PT_QuickMarkersPanel(bpy.types.Panel):
@@ -68,10 +280,8 @@ class VSEQF_UL_QuickMarkerList(bpy.types.UIList):
         pass
 
     def filter_items(self, context, data, property):
-        del context
-        markers = getattr(data, property)
-        helper = bpy.types.UI_UL_list
-        flt_neworder = helper.sort_items_helper(list(enumerate(markers)), key=lambda x: x[1].frame)
+        del context, property
+        flt_neworder = get_marker_index(data).sort_order()
         return [], flt_neworder
 
 
@@ -88,11 +298,12 @@ class VSEQFQuickMarkerDelete(bpy.types.Operator):
     def execute(self, context):
         scene = context.scene
         markers = scene.timeline_markers
-        for marker in markers:
-            if marker.frame == self.frame:
-                bpy.ops.ed.undo_push()
-                markers.remove(marker)
-                break
+        index = get_marker_index(scene)
+        position = index.at_frame(self.frame)
+        if position is not None:
+            bpy.ops.ed.undo_push()
+            markers.remove(markers[position])
+            index.remove(position)
         return{'FINISHED'}
 
 
@@ -105,15 +316,19 @@ class VSEQFQuickMarkerMove(bpy.types.Operator):
 
     def execute(self, context):
         marker = None
-        for timeline_marker in context.scene.timeline_markers:
+        marker_position = None
+        for position, timeline_marker in enumerate(context.scene.timeline_markers):
             if timeline_marker.frame == self.frame:
                 marker = timeline_marker
+                marker_position = position
                 timeline_marker.select = True
             else:
                 timeline_marker.select = False
         if marker:
             if self.to_cursor:
+                index = get_marker_index(context.scene)
                 marker.frame = context.scene.frame_current
+                index.move(marker_position, marker.frame)
             else:
                 bpy.ops.marker.move('INVOKE_DEFAULT')
         return {'FINISHED'}
@@ -201,7 +416,9 @@ class VSEQFQuickMarkersPlace(bpy.types.Operator):
                 exists = True
         if not exists:
             bpy.ops.ed.undo_push()
+            index = get_marker_index(scene)
             marker = scene.timeline_markers.new(name=self.marker, frame=frame)
+            index.add(frame)
             if scene.vseqf.marker_deselect:
                 marker.select = False
         return{'FINISHED'}
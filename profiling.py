@@ -0,0 +1,146 @@
+import bpy
+import time
+import functools
+from collections import deque
+
+enabled = False  #Set from the addon preferences, when False the profiled functions run without any timing
+buffer_size = 240  #Number of calls to remember the time of for each function
+timings = {}  #function name: deque of call times in seconds
+
+
+def profiled(function):
+    """Decorator for draw handlers, records how long each call takes when profiling is enabled"""
+
+    name = function.__name__
+
+    @functools.wraps(function)
+    def profiled_function(*args, **kwargs):
+        if not enabled:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record(name, time.perf_counter() - start)
+    return profiled_function
+
+
+def record(name, seconds):
+    times = timings.get(name)
+    if times is None:
+        times = deque(maxlen=buffer_size)
+        timings[name] = times
+    times.append(seconds)
+
+
+def reset():
+    timings.clear()
+
+
+def set_enabled(enable):
+    global enabled
+    enabled = enable
+    if not enable:
+        reset()
+
+
+def get_stats(name):
+    """Finds the statistics of the recorded times of a function
+    Arguments:
+        name: String, name of the profiled function
+
+    Returns: Dictionary of 'calls', 'min', 'avg', 'p95' and 'max', times are in milliseconds.  None if nothing has been recorded"""
+
+    times = timings.get(name)
+    if not times:
+        return None
+    ordered = sorted(times)
+    calls = len(ordered)
+    p95_index = min(int(round(0.95 * (calls - 1))), calls - 1)
+    return {
+        'calls': calls,
+        'min': ordered[0] * 1000,
+        'avg': sum(ordered) / calls * 1000,
+        'p95': ordered[p95_index] * 1000,
+        'max': ordered[-1] * 1000
+    }
+
+
+def report():
+    """Formats the statistics of all profiled functions as text
+    Returns: String"""
+
+    lines = ['VSEQF draw handler timings, in milliseconds, over the last '+str(buffer_size)+' calls of each handler', '']
+    lines.append('{:<32}{:>8}{:>10}{:>10}{:>10}{:>10}'.format('Handler', 'Calls', 'Min', 'Avg', 'P95', 'Max'))
+    for name in sorted(timings.keys()):
+        stats = get_stats(name)
+        if stats is None:
+            continue
+        lines.append('{:<32}{:>8}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}'.format(name, stats['calls'], stats['min'], stats['avg'], stats['p95'], stats['max']))
+    return '\n'.join(lines)
+
+
+class VSEQFProfilingDump(bpy.types.Operator):
+    """Writes the draw handler timings to the 'VSEQF Draw Timings' text"""
+    bl_idname = 'vseqf.profiling_dump'
+    bl_label = 'Write Draw Timings To Text'
+
+    def execute(self, context):
+        del context
+        text_document = bpy.data.texts.get('VSEQF Draw Timings')
+        if text_document is None:
+            text_document = bpy.data.texts.new('VSEQF Draw Timings')
+        text_document.clear()
+        text_document.from_string(report())
+        self.report({'INFO'}, "Draw timings written to text 'VSEQF Draw Timings'")
+        return {'FINISHED'}
+
+
+class VSEQFProfilingReset(bpy.types.Operator):
+    """Forgets all recorded draw handler timings"""
+    bl_idname = 'vseqf.profiling_reset'
+    bl_label = 'Reset Draw Timings'
+
+    def execute(self, context):
+        del context
+        reset()
+        return {'FINISHED'}
+
+
+class VSEQF_PT_ProfilingPanel(bpy.types.Panel):
+    """Panel showing the time taken by the VSEQF draw handlers.  Placed in the VSE properties area when profiling is
+    enabled in the addon preferences."""
+    bl_label = "VSEQF Draw Timings"
+    bl_space_type = 'SEQUENCE_EDITOR'
+    bl_region_type = 'UI'
+    bl_category = "Sequencer"
+    bl_options = {'DEFAULT_CLOSED'}
+
+    @classmethod
+    def poll(cls, context):
+        del context
+        return enabled
+
+    def draw(self, context):
+        del context
+        layout = self.layout
+        if not timings:
+            layout.label(text='No draw handlers have run yet')
+        else:
+            row = layout.row()
+            row.label(text='Handler')
+            row.label(text='Avg')
+            row.label(text='P95')
+            row.label(text='Min')
+            for name in sorted(timings.keys()):
+                stats = get_stats(name)
+                if stats is None:
+                    continue
+                row = layout.row()
+                row.label(text=name)
+                row.label(text=format(stats['avg'], '.2f')+'ms')
+                row.label(text=format(stats['p95'], '.2f')+'ms')
+                row.label(text=format(stats['min'], '.2f')+'ms')
+        row = layout.row()
+        row.operator('vseqf.profiling_dump', text='Write To Text')
+        row.operator('vseqf.profiling_reset', text='Reset')
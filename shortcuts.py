@@ -1,5 +1,7 @@
 import bpy
 from . import vseqf
+from . import timeline
+from . import markers
 
 
 def nudge_selected(frame=0, channel=0):
@@ -37,53 +39,18 @@ def find_marker(frame, direction):
     returns a marker object, or None if none found.
     """
 
-    return_marker = None
-    best_delta = None
-    for marker in bpy.context.scene.timeline_markers:
-        if direction == 'next':
-            if marker.frame > frame:
-                delta = marker.frame - frame
-                if best_delta is None or delta < best_delta:
-                    best_delta = delta
-                    return_marker = marker
-        elif direction == 'previous':
-            if marker.frame < frame:
-                delta = frame - marker.frame
-                if best_delta is None or delta < best_delta:
-                    best_delta = delta
-                    return_marker = marker
-        else:
-            delta = abs(frame - marker.frame)
-            if best_delta is None or delta < best_delta:
-                best_delta = delta
-                return_marker = marker
-    return return_marker
+    return markers.find_marker(bpy.context.scene, frame, direction)
 
 
-def find_edge(frame, direction):
+def find_edge(frame, direction, channel=None, selected=False):
     """Attempts to find the closest strip edge in the given direction.
     'direction' must be 'next' or 'previous'.
+    'channel' limits the search to strips on one channel, 'selected' limits the search to selected strips.
     returns a frame number, or None if none found.
     """
 
-    new_frame = None
-    best_delta = None
-    for strip in bpy.context.scene.sequence_editor.strips:
-        edges = [strip.left_handle, strip.right_handle]
-        for edge in edges:
-            if direction == 'next':
-                if edge > frame:
-                    delta = edge - frame
-                    if best_delta is None or delta < best_delta:
-                        best_delta = delta
-                        new_frame = edge
-            else:
-                if edge < frame:
-                    delta = frame - edge
-                    if best_delta is None or delta < best_delta:
-                        best_delta = delta
-                        new_frame = edge
-    return new_frame
+    edges = timeline.get_strip_edges(channel=channel, selected=selected)
+    return timeline.find_edge_frame(edges, frame, direction)
 
 
 class VSEQFQuickShortcutsNudge(bpy.types.Operator):
@@ -152,6 +119,8 @@ class VSEQFQuickShortcutsSkip(bpy.types.Operator):
     bl_label = 'Skip timeline location'
 
     type: bpy.props.EnumProperty(name='Type', items=[("NEXTSECOND", "One Second Forward", "", 1), ("LASTSECOND", "One Second Backward", "", 2), ("NEXTEDGE", "Next Clip Edge", "", 3), ("LASTEDGE", "Last Clip Edge", "", 4), ("LASTMARKER", "Last Marker", "", 5), ("NEXTMARKER", "Next Marker", "", 6), ("CLOSEMARKER", "Closest Marker", "", 7)])
+    channel: bpy.props.IntProperty(name='Channel', default=0, min=0, max=128, description='Only jump to edges of strips on this channel, 0 for all channels')
+    selected: bpy.props.BoolProperty(name='Selected Only', default=False, description='Only jump to edges of selected strips')
     tooltip: bpy.props.StringProperty("")
 
     def execute(self, context):
@@ -167,11 +136,11 @@ class VSEQFQuickShortcutsSkip(bpy.types.Operator):
         elif self.type == "LASTSECOND":
             context.scene.frame_current = context.scene.frame_current - second_frames
         elif self.type == "NEXTEDGE":
-            edge = find_edge(context.scene.frame_current, direction='next')
+            edge = find_edge(context.scene.frame_current, direction='next', channel=self.channel or None, selected=self.selected)
             if edge is not None:
                 context.scene.frame_current = edge
         elif self.type == "LASTEDGE":
-            edge = find_edge(context.scene.frame_current, direction='previous')
+            edge = find_edge(context.scene.frame_current, direction='previous', channel=self.channel or None, selected=self.selected)
             if edge is not None:
                 context.scene.frame_current = edge
         elif self.type == "LASTMARKER":
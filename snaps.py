@@ -162,7 +162,7 @@ class VSEQFQuickSnaps(bpy.types.Operator):
                     starting_data[data].select_left_handle = False
                     starting_data[data].select_right_handle = False
                 for strip in to_snap:
-                    previous = timeline.find_close_strip(strips, strip, 'previous', 'nooverlap', sounds=True)
+                    previous = timeline.find_close_strip(None, strip, 'previous', 'nooverlap', sounds=True)
                     if previous:
                         offset_x = (previous.right_handle - strip.left_handle)
                         grabs.move_strips(context, starting_data, offset_x, 0, [strip])
@@ -175,7 +175,7 @@ class VSEQFQuickSnaps(bpy.types.Operator):
                     starting_data[data].select_left_handle = False
                     starting_data[data].select_right_handle = False
                 for strip in to_snap:
-                    next_seq = timeline.find_close_strip(strips, strip, 'next', 'nooverlap', sounds=True)
+                    next_seq = timeline.find_close_strip(None, strip, 'next', 'nooverlap', sounds=True)
                     if next_seq:
                         offset_x = (next_seq.left_handle - strip.right_handle)
                         grabs.move_strips(context, starting_data, offset_x, 0, [strip])
@@ -2,6 +2,7 @@ import bpy
 import os
 from . import timeline
 from . import vseqf
+from . import profiling
 
 
 def update_import_frame_in(self, fps):
@@ -122,6 +123,8 @@ def update_import_frames_length(self, context):
     update_import_frame_length(self, fps)
 
 
+@profiling.profiled
+@vseqf.draw_batched
 def three_point_draw_callback(self, context):
     colorfg = (1.0, 1.0, 1.0, 1.0)
     colorbg = (0.1, 0.1, 0.1, 1.0)
@@ -522,7 +525,7 @@ class VSEQFThreePointOperator(bpy.types.Operator):
             context.scene.frame_end = self.out_frame
 
     def modal(self, context, event):
-        context.area.tag_redraw()
+        vseqf.redraw_area(context.area)
         if event.type == 'SPACE' and event.value == 'PRESS':
             #play/pause
             bpy.ops.screen.animation_play()
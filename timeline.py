@@ -1,7 +1,16 @@
 import bpy
+import bisect
+from array import array
 from . import vseqf
 
 
+strip_geometry = None
+strip_geometry_key = None
+strip_geometry_changed = True  #strips may have moved, cached geometry needs to be compared against the timeline
+strip_geometry_invalid = True  #strip pointers may no longer be valid, cached geometry needs to be rebuilt
+msgbus_owner = object()
+
+
 #Meta strip manipulations
 def inside_meta_strip():
     try:
@@ -45,6 +54,7 @@ def current_selected(context):
 
 
 def current_strips(context):
+    #the live strips are returned, cached rows may hold references to strips removed since the last refresh
     strips = context.strips
     if strips:
         return strips
@@ -52,7 +62,9 @@ def current_strips(context):
         return []
 
 
-def find_strips_end(strips):
+def find_strips_end(strips=None):
+    if strips is None:
+        return max(1, max(get_strip_geometry().rights, default=1))
     end = 1
     for strip in strips:
         if strip.right_handle > end:
@@ -60,7 +72,9 @@ def find_strips_end(strips):
     return end
 
 
-def find_strips_start(strips):
+def find_strips_start(strips=None):
+    if strips is None:
+        return min(get_strip_geometry().lefts, default=1)
     if not strips:
         return 1
     start = strips[0].left_handle
@@ -70,7 +84,9 @@ def find_strips_start(strips):
     return start
 
 
-def find_timeline_height(strips):
+def find_timeline_height(strips=None):
+    if strips is None:
+        return max(1, max(get_strip_geometry().channels, default=1))
     height = 1
     for strip in strips:
         if strip.channel > height:
@@ -81,7 +97,8 @@ def find_timeline_height(strips):
 def find_close_strip(strips, selected_strip, direction, mode='overlap', sounds=False, effects=True):
     """Finds the closest strip in one direction to the given strip
     Arguments:
-        strips: List of strips to search through
+        strips: List of strips to search through, if None, the strips in the current timeline will be searched using
+            the cached strip geometry
         selected_strip: VSE Strip object that will be used as the basis for the search
         direction: String, must be 'next' or 'previous', determines the direction to search in
         mode: String, determines how the strips are searched
@@ -93,9 +110,12 @@ def find_close_strip(strips, selected_strip, direction, mode='overlap', sounds=F
         sounds: Boolean, if False, 'SOUND' strip types are ignored
         effects: Boolean, if False, effect strips that are applied to another strip are ignored
 
-    Returns: VSE Strip object, or Boolean False if no matching strip is found
+    Returns: VSE Strip object, or None if no matching strip is found
     :rtype: bpy.types.Strip"""
 
+    if strips is None:
+        return get_strip_geometry().get_neighbours().find(selected_strip, direction, mode, sounds, effects)
+
     overlap_nexts = []
     overlap_previous = []
     nexts = []
@@ -178,11 +198,11 @@ def sequencer_used_height(left, right, strips=None):
     top = 0
     bottom = 0
     if not strips:
-        strips = current_strips(bpy.context)
+        return get_strip_index().used_height(left, right)
     for seq in strips:
         start = seq.left_handle
         end = seq.right_handle
-        if (start > left and start < right) or (end > left and end < right) or (start < left and end > right):
+        if used_overlaps(start, end, left, right):
             if bottom == 0:
                 bottom = seq.channel
             elif seq.channel < bottom:
@@ -203,37 +223,39 @@ def sequencer_area_clear(strips, left, right, bottom, top):
     return False
 
 
-def sequencer_area_filled(left, right, bottom, top, omit, strips=False, quick=True):
-    """Iterates through strips and checks if any are partially or fully in the given area
+def sequencer_area_filled(left, right, bottom, top, omit, strips=False, quick=True, index=None):
+    """Checks if any strips are partially or fully in the given area
     Arguments:
         left: Starting frame of the area to check
         right: Ending frame of the area to check
         bottom: Lowest channel of the area to check
         top: Highest channel of the area to check, set to -1 for infinite range
         omit: List of strips to ignore
-        strips: List of strips to check, if not given, bpy.context.scene.sequence_editor.strips will be used
+        strips: List of strips to check, if not given, the strip index of the current timeline will be used
         quick: If True, the function will stop iterating and return True on the first match, otherwise returns list of
             all matches
+        index: StripIndex to check instead of the cached index of the current timeline, ignored if strips is given
 
     Returns: If quick=True, returns True if a strip is in the area, False if none are in the area.
         If quick==False, returns a list of all matching strips if any are in the given area."""
 
-    right = right
     if top != -1:
         if bottom > top:
             old_top = top
             top = bottom
             bottom = old_top
-    matches = []
     if not strips:
-        strips = current_strips(bpy.context)
+        if index is None:
+            index = get_strip_index(bpy.context)
+        return index.area_filled(left, right, bottom, top, omit, quick=quick)
+
+    matches = []
     for strip in strips:
         if strip not in omit:
             if strip.channel >= bottom and (strip.channel <= top or top == -1):
                 start = strip.left_handle
                 end = strip.right_handle
-                #strip start is inside area             strip end is inside area         entire strip is covering area
-                if (start >= left and start < right) or (end > left and end <= right) or (start <= left and end >= right):
+                if area_overlaps(start, end, left, right):
                     if quick:
                         return True
                     else:
@@ -243,6 +265,764 @@ def sequencer_area_filled(left, right, bottom, top, omit, strips=False, quick=Tr
     return False
 
 
+def merge_intervals(intervals):
+    """Sorts frame ranges and merges any that overlap or touch
+    Arguments:
+        intervals: List of [start, end] frame ranges, both ends are included in the range
+
+    Returns: Sorted list of non-overlapping [start, end] frame ranges"""
+
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def area_overlaps(start, end, left, right):
+    #strip start is inside area             strip end is inside area         entire strip is covering area
+    return (start >= left and start < right) or (end > left and end <= right) or (start <= left and end >= right)
+
+
+def used_overlaps(start, end, left, right):
+    #Like area_overlaps(), but strips only touching the edges of the area do not count
+    return (start > left and start < right) or (end > left and end < right) or (start < left and end > right)
+
+
+class StripIndex(object):
+    """Per-channel index of strip intervals, sorted by left_handle.
+    Used to answer 'is this frame range on this channel occupied' without iterating over every strip.
+    The index only knows what it was last told, so any code that moves strips while using an index should call
+    update() on the moved strips afterwards."""
+
+    def __init__(self, strips=None):
+        self.channels = {}  #channel number: [sorted list of left handles, list of [left, right, pointer, strip] entries]
+        self.max_lengths = {}  #channel number: length of the longest strip in the channel
+        self.positions = {}  #strip pointer: [channel, left, right]
+        self.channel_order = []  #sorted list of every channel number that has been used
+        self.geometry = None  #StripGeometry that owns this index, kept in sync with any strips added to the index
+        if strips:
+            self.rebuild(strips)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def rebuild(self, strips):
+        self.channels = {}
+        self.max_lengths = {}
+        self.positions = {}
+        self.channel_order = []
+        for strip in strips:
+            self.add(strip)
+
+    def add(self, strip, channel=None, left=None, right=None, pointer=None):
+        """Adds a strip to the index, the position is read from the strip unless given"""
+        if pointer is None:
+            pointer = strip.as_pointer()
+        if pointer in self.positions:
+            self.remove(strip, pointer=pointer)
+        if channel is None:
+            channel = strip.channel
+        if left is None:
+            left = strip.left_handle
+        if right is None:
+            right = strip.right_handle
+        if channel not in self.channels:
+            self.channels[channel] = [[], []]
+            self.max_lengths[channel] = 0
+            bisect.insort(self.channel_order, channel)
+        lefts, entries = self.channels[channel]
+        position = bisect.bisect_right(lefts, left)
+        lefts.insert(position, left)
+        entries.insert(position, [left, right, pointer, strip])
+        if right - left > self.max_lengths[channel]:
+            self.max_lengths[channel] = right - left
+        self.positions[pointer] = [channel, left, right]
+        if self.geometry is not None:
+            self.geometry.patch_row(strip, pointer, channel, left, right)
+
+    def remove(self, strip, pointer=None):
+        if pointer is None:
+            pointer = strip.as_pointer()
+        position = self.positions.pop(pointer, None)
+        if position is None:
+            return
+        channel, left, right = position
+        lefts, entries = self.channels[channel]
+        start = bisect.bisect_left(lefts, left)
+        end = bisect.bisect_right(lefts, left)
+        for entry_index in range(start, end):
+            if entries[entry_index][2] == pointer:
+                del lefts[entry_index]
+                del entries[entry_index]
+                break
+        if right - left >= self.max_lengths[channel]:
+            #the longest strip was removed or moved, another strip may now be the longest
+            self.max_lengths[channel] = max((entry[1] - entry[0] for entry in entries), default=0)
+
+    def update(self, strip):
+        """Re-reads the position of a strip that may have been moved, only changes the index if it was"""
+        position = self.positions.get(strip.as_pointer())
+        channel = strip.channel
+        left = strip.left_handle
+        right = strip.right_handle
+        if position is not None and position == [channel, left, right]:
+            return
+        self.add(strip, channel, left, right)
+
+    def update_strips(self, strips):
+        for strip in strips:
+            self.update(strip)
+
+    def channel_filled(self, channel, left, right, omit_pointers=(), quick=True, overlaps=area_overlaps):
+        """Checks a single channel for strips in the given frame range
+        Arguments:
+            channel: Channel number to check
+            left: Starting frame of the area to check
+            right: Ending frame of the area to check
+            omit_pointers: Collection of strip pointers to ignore
+            quick: If True, returns True on the first match, otherwise returns a list of all matching strips
+            overlaps: Function deciding if a strip start and end overlap the area, area_overlaps() or used_overlaps()
+
+        Returns: True or False if quick, otherwise a list of strips"""
+
+        matches = []
+        channel_data = self.channels.get(channel)
+        if not channel_data:
+            if quick:
+                return False
+            return matches
+        lefts, entries = channel_data
+        #only strips starting within one maximum strip length before the area can reach into it
+        first = bisect.bisect_left(lefts, left - self.max_lengths[channel])
+        last = bisect.bisect_right(lefts, right)
+        for entry_index in range(first, last):
+            start, end, pointer, strip = entries[entry_index]
+            if pointer in omit_pointers:
+                continue
+            if overlaps(start, end, left, right):
+                if quick:
+                    return True
+                matches.append(strip)
+        if quick:
+            return False
+        return matches
+
+    def find_free_channel(self, left, right, channel, omit_pointers=()):
+        """Finds the lowest channel at or above the given channel that has no strips in the frame range
+        Arguments:
+            left: Starting frame of the area to place
+            right: Ending frame of the area to place
+            channel: Lowest channel that can be returned
+            omit_pointers: Collection of strip pointers to ignore
+
+        Returns: Integer channel number"""
+
+        position = bisect.bisect_left(self.channel_order, channel)
+        for used_channel in self.channel_order[position:]:
+            if used_channel != channel:
+                #channel has never had a strip in it
+                break
+            if not self.channel_filled(channel, left, right, omit_pointers):
+                break
+            channel = channel + 1
+        return channel
+
+    def place_strips(self, placements):
+        """Finds free channels for a group of strips that are being moved together.
+        The strips are removed from their old positions first so they can not block each other, then each is given the
+        lowest free channel at or above its requested channel, and is stored in that position so the strips placed
+        after it will avoid it.
+        Arguments:
+            placements: List of [strip, left, right, channel] lists, giving the new frame range and lowest channel
+                for each strip, strips are placed in this order
+
+        Returns: List of channel numbers, in the same order as placements"""
+
+        for placement in placements:
+            self.remove(placement[0])
+        channels = []
+        for strip, left, right, channel in placements:
+            channel = self.find_free_channel(left, right, channel)
+            self.add(strip, channel, left, right)
+            channels.append(channel)
+        return channels
+
+    def used_height(self, left, right):
+        """Index-backed equivalent of sequencer_used_height(), channels are checked from the bottom and top inwards so
+        only the channels below the lowest and above the highest used channel need to be checked."""
+        bottom = 0
+        top = 0
+        for channel in self.channel_order:
+            if self.channel_filled(channel, left, right, overlaps=used_overlaps):
+                bottom = channel
+                break
+        if bottom:
+            for channel in reversed(self.channel_order):
+                if self.channel_filled(channel, left, right, overlaps=used_overlaps):
+                    top = channel
+                    break
+        return [bottom, top]
+
+    def area_filled(self, left, right, bottom, top, omit, quick=True):
+        """Index-backed equivalent of sequencer_area_filled(), see that function for arguments"""
+        omit_pointers = set(strip.as_pointer() for strip in omit)
+        if bottom == top:
+            channels = [bottom]
+        else:
+            channels = sorted(channel for channel in self.channels if channel >= bottom and (channel <= top or top == -1))
+        matches = []
+        for channel in channels:
+            found = self.channel_filled(channel, left, right, omit_pointers, quick=quick)
+            if quick:
+                if found:
+                    return True
+            else:
+                matches.extend(found)
+        if matches and not quick:
+            return matches
+        return False
+
+
+class StripGeometry(object):
+    """Compact copy of the position and state of every strip in a timeline, row by row in collection order.
+    Values are read in bulk with foreach_get, so comparing the cache to the timeline only needs per-strip RNA access for
+    rows that have actually changed, which are then patched into the StripIndex.  The cache is only used for queries, callers that need the strips
+    themselves should use the live collection."""
+
+    def __init__(self, collection=None, channels=None):
+        self.strips = []
+        self.pointers = array('Q')
+        self.channels = array('i')
+        self.lefts = array('i')
+        self.rights = array('i')
+        self.locks = array('b')
+        self.mutes = array('b')
+        self.effects = array('b')
+        self.types = []
+        self.channel_locks = array('b')
+        self.channel_mutes = array('b')
+        self.rows = {}  #strip pointer: row number
+        self.index = StripIndex()
+        self.edge_cache = {}  #(channel, selected): [selection state bytes, sorted list of unique edge frames]
+        self.neighbours = None  #StripNeighbours, created when first needed
+        self.crossfades = None  #(input_1 pointer, input_2 pointer): effect strip, created when first needed
+        self.dependents = None  #strip pointer: list of rows of effect strips using that strip, created when first needed
+        if collection is not None:
+            self.rebuild(collection, channels)
+
+    def __len__(self):
+        return len(self.strips)
+
+    def rebuild(self, collection, channels=None):
+        """Reads every strip in the collection and builds a new StripIndex from them
+        Arguments:
+            collection: bpy_prop_collection of strips
+            channels: bpy_prop_collection of timeline channels, used for channel lock and mute"""
+
+        self.strips = list(collection)
+        self.channels, self.lefts, self.rights, self.locks, self.mutes = read_strip_arrays(collection)
+        self.pointers = array('Q', [strip.as_pointer() for strip in self.strips])
+        self.effects = array('b', [hasattr(strip, 'input_1') for strip in self.strips])
+        self.types = [strip.type for strip in self.strips]
+        self.rows = {pointer: row for row, pointer in enumerate(self.pointers)}
+        self.edge_cache = {}
+        self.neighbours = None
+        self.crossfades = None
+        self.dependents = None
+        self.read_channels(channels)
+        self.index = StripIndex()
+        for row, strip in enumerate(self.strips):
+            self.index.add(strip, self.channels[row], self.lefts[row], self.rights[row], pointer=self.pointers[row])
+        self.index.geometry = self
+
+    def read_channels(self, channels):
+        if channels is None:
+            self.channel_locks = array('b')
+            self.channel_mutes = array('b')
+            return
+        self.channel_locks = read_array(channels, 'lock', 'b')
+        self.channel_mutes = read_array(channels, 'mute', 'b')
+
+    def refresh(self, collection, channels=None):
+        """Compares the cache to the current state of the collection and patches any rows that changed
+        Arguments:
+            collection: bpy_prop_collection of strips, must be the same length as the cache
+            channels: bpy_prop_collection of timeline channels, used for channel lock and mute
+
+        Returns: False if the collection no longer matches the cached rows and the cache needs to be rebuilt,
+            otherwise the number of rows that were patched"""
+
+        channel_values, lefts, rights, self.locks, self.mutes = read_strip_arrays(collection)
+        self.read_channels(channels)
+        self.crossfades = None
+        self.dependents = None
+        #added and removed strips change the collection length, which get_strip_geometry() checks before refreshing.
+        #a strip replaced in the same update is added to the end, so only the last row needs to be checked for that
+        if self.strips and collection[-1].as_pointer() != self.pointers[-1]:
+            return False
+        if channel_values == self.channels and lefts == self.lefts and rights == self.rights:
+            return 0
+        patched = 0
+        for row in range(len(self.strips)):
+            channel = channel_values[row]
+            left = lefts[row]
+            right = rights[row]
+            if channel == self.channels[row] and left == self.lefts[row] and right == self.rights[row]:
+                continue
+            if collection[row].as_pointer() != self.pointers[row]:
+                #strips in the collection have been reordered or replaced, rows can no longer be matched up
+                return False
+            strip = self.strips[row]
+            #the index passes the new position back to patch_row()
+            self.index.add(strip, channel, left, right, pointer=self.pointers[row])
+            patched = patched + 1
+        return patched
+
+    def patch_row(self, strip, pointer, channel, left, right):
+        """Updates the cached position of a strip, called by the StripIndex whenever a strip is added to it.
+        Strips that are not in the cache yet are assumed to have been added to the end of the collection."""
+
+        row = self.rows.get(pointer)
+        if row is None:
+            self.append_row(strip, pointer, channel, left, right)
+            return
+        if self.channels[row] == channel and self.lefts[row] == left and self.rights[row] == right:
+            return
+        if self.neighbours is not None:
+            self.neighbours.remove_row(row)
+        self.channels[row] = channel
+        self.lefts[row] = left
+        self.rights[row] = right
+        if self.neighbours is not None:
+            self.neighbours.add_row(row)
+        self.edge_cache = {}
+        #effect strips follow the strips they are applied to
+        for effect_row in self.get_dependents().get(pointer, []):
+            self.index.update(self.strips[effect_row])
+
+    def append_row(self, strip, pointer, channel, left, right):
+        row = len(self.strips)
+        self.strips.append(strip)
+        self.pointers.append(pointer)
+        self.channels.append(channel)
+        self.lefts.append(left)
+        self.rights.append(right)
+        self.locks.append(strip.lock)
+        self.mutes.append(strip.mute)
+        self.effects.append(hasattr(strip, 'input_1'))
+        self.types.append(strip.type)
+        self.rows[pointer] = row
+        if self.neighbours is not None:
+            self.neighbours.add_row(row)
+        if self.crossfades is not None and hasattr(strip, 'input_2'):
+            self.add_crossfade(strip)
+        if self.dependents is not None and self.effects[row]:
+            self.add_dependent(row)
+        self.edge_cache = {}
+
+    def edges(self, channel=None, selection=None):
+        """Returns a sorted list of the unique left and right handle frames of the cached strips
+        Arguments:
+            channel: Integer, if given, only strips on this channel are included
+            selection: array of strip select states in collection order, if given only selected strips are included
+
+        Returns: List of integers"""
+
+        key = (channel, selection is not None)
+        if selection is not None:
+            selection_state = selection.tobytes()
+        else:
+            selection_state = None
+        cached = self.edge_cache.get(key)
+        if cached is not None and cached[0] == selection_state:
+            return cached[1]
+        edges = set()
+        for row in range(len(self.strips)):
+            if channel is not None and self.channels[row] != channel:
+                continue
+            if selection is not None and not selection[row]:
+                continue
+            edges.add(self.lefts[row])
+            edges.add(self.rights[row])
+        edges = sorted(edges)
+        self.edge_cache[key] = [selection_state, edges]
+        return edges
+
+    def row(self, strip):
+        return self.rows.get(strip.as_pointer())
+
+    def get_neighbours(self):
+        if self.neighbours is None:
+            self.neighbours = StripNeighbours(self)
+        return self.neighbours
+
+    def get_dependents(self):
+        if self.dependents is None:
+            self.dependents = {}
+            for row in range(len(self.strips)):
+                if self.effects[row]:
+                    self.add_dependent(row)
+        return self.dependents
+
+    def add_dependent(self, row):
+        strip = self.strips[row]
+        for input_strip in [strip.input_1, getattr(strip, 'input_2', None)]:
+            if input_strip is not None:
+                self.dependents.setdefault(input_strip.as_pointer(), []).append(row)
+
+    def add_crossfade(self, strip):
+        if strip.input_1 is not None and strip.input_2 is not None:
+            self.crossfades[(strip.input_1.as_pointer(), strip.input_2.as_pointer())] = strip
+
+    def find_crossfade(self, first_strip, second_strip):
+        """Finds an effect strip that uses the two given strips as inputs, in either order
+        Arguments:
+            first_strip: VSE Strip object
+            second_strip: VSE Strip object
+
+        Returns: VSE Strip object, or None if no effect uses both strips"""
+
+        if self.crossfades is None:
+            self.crossfades = {}
+            for row, strip in enumerate(self.strips):
+                if self.effects[row] and hasattr(strip, 'input_2'):
+                    self.add_crossfade(strip)
+        first_pointer = first_strip.as_pointer()
+        second_pointer = second_strip.as_pointer()
+        for key in [(first_pointer, second_pointer), (second_pointer, first_pointer)]:
+            strip = self.crossfades.get(key)
+            if strip is not None:
+                return strip
+        return None
+
+    def is_locked(self, row):
+        """Equivalent to is_locked() for a cached row"""
+        channel = self.channels[row]
+        return bool(self.locks[row] or (channel < len(self.channel_locks) and self.channel_locks[channel]))
+
+    def is_muted(self, row):
+        """Equivalent to is_muted() for a cached row"""
+        channel = self.channels[row]
+        return bool(self.mutes[row] or (channel < len(self.channel_mutes) and self.channel_mutes[channel]))
+
+
+class StripNeighbours(object):
+    """Sorted start and end frames of the rows of a StripGeometry, used by find_close_strip().
+    Rows are split into sound, effect and other strips, for the whole timeline and for each channel, so the sound and
+    effect filters and the 'channel' mode only look at the strips they can return.  Every list holds (frame, row)
+    tuples, so strips on the same frame are in collection order, matching the order the linear search used to pick."""
+
+    def __init__(self, geometry):
+        self.geometry = geometry
+        self.buckets = {}  #(kind, channel or None): [(left, row) list, (-left, row) list, (-right, row) list]
+        for row in range(len(geometry)):
+            for bucket in self.row_buckets(row):
+                bucket[0].append((geometry.lefts[row], row))
+                bucket[1].append((-geometry.lefts[row], row))
+                bucket[2].append((-geometry.rights[row], row))
+        for bucket in self.buckets.values():
+            for entries in bucket:
+                entries.sort()
+
+    def row_kind(self, row):
+        if self.geometry.types[row] == 'SOUND':
+            return 'sound'
+        if self.geometry.effects[row]:
+            return 'effect'
+        return 'other'
+
+    def row_buckets(self, row):
+        kind = self.row_kind(row)
+        buckets = []
+        for key in [(kind, None), (kind, self.geometry.channels[row])]:
+            if key not in self.buckets:
+                self.buckets[key] = [[], [], []]
+            buckets.append(self.buckets[key])
+        return buckets
+
+    def add_row(self, row):
+        geometry = self.geometry
+        for bucket in self.row_buckets(row):
+            bisect.insort(bucket[0], (geometry.lefts[row], row))
+            bisect.insort(bucket[1], (-geometry.lefts[row], row))
+            bisect.insort(bucket[2], (-geometry.rights[row], row))
+
+    def remove_row(self, row):
+        geometry = self.geometry
+        for bucket in self.row_buckets(row):
+            for entries, entry in zip(bucket, [(geometry.lefts[row], row), (-geometry.lefts[row], row), (-geometry.rights[row], row)]):
+                position = bisect.bisect_left(entries, entry)
+                if position < len(entries) and entries[position] == entry:
+                    del entries[position]
+
+    def lists(self, kinds, channel, list_index):
+        found = []
+        for kind in kinds:
+            bucket = self.buckets.get((kind, channel))
+            if bucket:
+                found.append(bucket[list_index])
+        return found
+
+    def first(self, lists, start, stop, accept):
+        """Finds the lowest entry from start up to stop in any of the lists that is accepted
+        Arguments:
+            lists: List of sorted lists of (frame, row) tuples
+            start: Tuple, entries lower than this are ignored
+            stop: Tuple or None, entries at or above this are ignored
+            accept: Function that is given a row number and returns True if the row can be returned
+
+        Returns: The lowest accepted (frame, row) tuple, or None"""
+
+        best = None
+        for entries in lists:
+            position = bisect.bisect_left(entries, start)
+            while position < len(entries):
+                entry = entries[position]
+                if (stop is not None and entry >= stop) or (best is not None and entry > best):
+                    break
+                if accept(entry[1]):
+                    best = entry
+                    break
+                position = position + 1
+        return best
+
+    def all(self, lists, start, stop, accept):
+        #Returns every accepted row from start up to stop in all of the lists
+        rows = []
+        for entries in lists:
+            position = bisect.bisect_left(entries, start)
+            while position < len(entries):
+                entry = entries[position]
+                if entry >= stop:
+                    break
+                if accept(entry[1]):
+                    rows.append(entry[1])
+                position = position + 1
+        return rows
+
+    def find(self, selected_strip, direction, mode, sounds, effects):
+        """Index-backed equivalent of find_close_strip(), see that function for arguments"""
+
+        geometry = self.geometry
+        selected_row = geometry.row(selected_strip)
+        left = selected_strip.left_handle
+        right = selected_strip.right_handle
+        channel = selected_strip.channel
+        kinds = ['other']
+        if sounds:
+            kinds.append('sound')
+        if effects:
+            kinds.append('effect')
+        after = float('inf')  #sorts after any row on the same frame
+        before = -1  #sorts before any row on the same frame
+
+        def accept(row):
+            if row == selected_row:
+                return False
+            if geometry.effects[row] and geometry.strips[row].input_1 == selected_strip:
+                return False
+            return True
+
+        def accept_overlap_next(row):
+            return geometry.rights[row] > right and geometry.lefts[row] > left and accept(row)
+
+        def accept_overlap_previous(row):
+            return geometry.lefts[row] < left and geometry.rights[row] < right and accept(row)
+
+        def closest_channel(rows):
+            if not rows:
+                return None
+            return min(rows, key=lambda row: (abs(geometry.channels[row] - channel), row))
+
+        if mode == 'simple':
+            if direction == 'next':
+                found = self.first(self.lists(kinds, None, 0), (left, after), None, accept)
+            else:
+                found = self.first(self.lists(kinds, None, 1), (-left, before), None, accept)
+            if found is None:
+                return None
+            return geometry.strips[found[1]]
+
+        found = None
+        if direction == 'next':
+            if mode == 'overlap':
+                row = closest_channel(self.all(self.lists(kinds, None, 0), (left, after), (right, before), accept_overlap_next))
+                if row is not None:
+                    return geometry.strips[row]
+                return None
+            if mode not in ['channel', 'nooverlap']:
+                found = self.first(self.lists(kinds, None, 0), (left, after), (right, before), accept_overlap_next)
+            if found is None:
+                lists = self.lists(kinds, channel if mode == 'channel' else None, 0)
+                found = self.first(lists, (right, before), None, accept)
+        else:
+            if mode == 'overlap':
+                row = closest_channel(self.all(self.lists(kinds, None, 2), (-right, after), (-left, before), accept_overlap_previous))
+                if row is not None:
+                    return geometry.strips[row]
+                return None
+            if mode not in ['channel', 'nooverlap']:
+                found = self.first(self.lists(kinds, None, 2), (-right, after), (-left, before), accept_overlap_previous)
+            if found is None:
+                lists = self.lists(kinds, channel if mode == 'channel' else None, 2)
+                found = self.first(lists, (-left, before), None, accept)
+        if found is None:
+            return None
+        return geometry.strips[found[1]]
+
+
+def read_array(collection, attribute, typecode):
+    """Reads one property of every item in a bpy_prop_collection into an array
+    Arguments:
+        collection: bpy_prop_collection to read from
+        attribute: String, name of the property
+        typecode: String, array typecode to store the values in
+
+    Returns: array.array"""
+
+    values = array(typecode, [0]) * len(collection)
+    try:
+        collection.foreach_get(attribute, values)
+    except (AttributeError, TypeError, RuntimeError):
+        values = array(typecode, [getattr(item, attribute) for item in collection])
+    return values
+
+
+def read_strip_arrays(collection):
+    #Returns arrays of channel, left_handle, right_handle, lock and mute for every strip in the collection
+    return [read_array(collection, 'channel', 'i'), read_array(collection, 'left_handle', 'i'), read_array(collection, 'right_handle', 'i'), read_array(collection, 'lock', 'b'), read_array(collection, 'mute', 'b')]
+
+
+def current_strips_collection(context):
+    """Returns the strips collection being displayed in the sequencer, taking meta strips into account"""
+    sequence_editor = context.scene.sequence_editor
+    if not sequence_editor:
+        return None
+    if len(sequence_editor.meta_stack) > 0:
+        return sequence_editor.meta_stack[-1].strips
+    return sequence_editor.strips
+
+
+def current_channels_collection(context):
+    """Returns the channels collection being displayed in the sequencer, taking meta strips into account"""
+    sequence_editor = context.scene.sequence_editor
+    if not sequence_editor:
+        return None
+    if len(sequence_editor.meta_stack) > 0:
+        return sequence_editor.meta_stack[-1].channels
+    return sequence_editor.channels
+
+
+def strip_geometry_tag_changed(*_):
+    #Called by handlers and msgbus whenever strips may have been moved or changed outside of the cache
+    global strip_geometry_changed
+    strip_geometry_changed = True
+
+
+def strip_geometry_tag_invalid(*_):
+    #Called by handlers when strip data may have been reallocated, such as after undo or loading a file
+    global strip_geometry_invalid
+    strip_geometry_invalid = True
+
+
+def get_strip_geometry(context=None):
+    """Returns the StripGeometry cache for the current timeline.
+    The cache is compared against the timeline only if something has been changed since it was last used, and is only
+    rebuilt if the timeline, the number of strips or the order of strips has changed."""
+
+    global strip_geometry
+    global strip_geometry_key
+    global strip_geometry_changed
+    global strip_geometry_invalid
+    if context is None:
+        context = bpy.context
+    collection = current_strips_collection(context)
+    if collection is None:
+        return StripGeometry()
+    sequence_editor = context.scene.sequence_editor
+    if len(sequence_editor.meta_stack) > 0:
+        key = (context.scene.as_pointer(), sequence_editor.meta_stack[-1].as_pointer())
+    else:
+        key = (context.scene.as_pointer(), 0)
+    channels = current_channels_collection(context)
+    if strip_geometry is None or strip_geometry_invalid or key != strip_geometry_key or len(strip_geometry) != len(collection):
+        strip_geometry = StripGeometry(collection, channels)
+        strip_geometry_key = key
+    elif strip_geometry_changed:
+        if strip_geometry.refresh(collection, channels) is False:
+            strip_geometry.rebuild(collection, channels)
+    strip_geometry_changed = False
+    strip_geometry_invalid = False
+    return strip_geometry
+
+
+def get_strip_index(context=None):
+    """Returns the StripIndex for the current timeline, kept up to date by the StripGeometry cache"""
+    return get_strip_geometry(context).index
+
+
+def get_strip_edges(context=None, channel=None, selected=False):
+    """Returns a sorted list of unique strip edge frames in the current timeline
+    Arguments:
+        context: Blender context, bpy.context will be used if not given
+        channel: Integer, if given, only strips on this channel are included
+        selected: Boolean, if True, only selected strips are included
+
+    Returns: List of integers"""
+
+    if context is None:
+        context = bpy.context
+    geometry = get_strip_geometry(context)
+    selection = None
+    if selected:
+        collection = current_strips_collection(context)
+        if collection is None:
+            return []
+        selection = read_array(collection, 'select', 'b')
+    return geometry.edges(channel, selection)
+
+
+def find_edge_frame(edges, frame, direction):
+    """Finds the closest edge frame to one side of a frame
+    Arguments:
+        edges: Sorted list of edge frames, as given by get_strip_edges()
+        frame: Integer, the frame to search from
+        direction: String, 'next', 'previous' or 'closest'
+
+    Returns: Integer frame number, or None if there is no edge in that direction"""
+
+    if direction == 'next':
+        position = bisect.bisect_right(edges, frame)
+        if position < len(edges):
+            return edges[position]
+    elif direction == 'closest':
+        position = bisect.bisect_left(edges, frame)
+        candidates = edges[max(0, position - 1):position + 1]
+        if candidates:
+            return min(candidates, key=lambda edge: abs(edge - frame))
+    else:
+        position = bisect.bisect_left(edges, frame)
+        if position > 0:
+            return edges[position - 1]
+    return None
+
+
+def subscribe_strip_changes():
+    """Subscribes to lock, mute and channel changes that do not always cause a depsgraph update"""
+    unsubscribe_strip_changes()
+    keys = [(bpy.types.Strip, 'lock'), (bpy.types.Strip, 'mute'), (bpy.types.Strip, 'channel'), (bpy.types.SequenceTimelineChannel, 'lock'), (bpy.types.SequenceTimelineChannel, 'mute')]
+    for key in keys:
+        bpy.msgbus.subscribe_rna(key=key, owner=msgbus_owner, args=(), notify=strip_geometry_tag_changed)
+
+
+def unsubscribe_strip_changes():
+    bpy.msgbus.clear_by_owner(msgbus_owner)
+
+
 def under_cursor(strip, frame):
     """Check if a strip is visible on a frame
     Arguments:
@@ -383,6 +1163,7 @@ class VSEQFQuickTimelineMenu(bpy.types.Menu):
         del context
         layout = self.layout
         layout.operator('vseqf.check_clipping')
+        layout.operator('vseqf.loudness_report')
         layout.separator()
         props = layout.operator('vseqf.quicktimeline', text='Timeline To All')
         props.operation = 'strips'
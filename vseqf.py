@@ -2,6 +2,9 @@ import bpy
 import gpu
 import blf
 import math
+import time
+import functools
+from mathutils import Matrix
 from gpu_extras.batch import batch_for_shader
 
 
@@ -14,6 +17,11 @@ class VSEQFTempSettings(object):
     edit = True
     threepoint = True
     context_menu = True
+    overlay_limit = 100
+    vu_max_fps = 30
+    profile_draw = False
+    envelope_cache_size = 512
+    envelope_cache_directory = ''
 
 
 def add_to_value(value, character, is_float=True):
@@ -51,50 +59,244 @@ def add_to_value(value, character, is_float=True):
 
 
 #Drawing functions
+class DrawList(object):
+    """Collects the rectangles, lines, triangles and text of one redraw so they can be drawn with as few batches as
+    possible.  Everything is drawn in the order it was added, so the result looks the same as drawing immediately, but
+    shapes of the same type added one after another are drawn as a single batch.  Shapes use a per-vertex color shader,
+    so shapes of any color can share a batch."""
+
+    def __init__(self):
+        self.runs = []  #lists of ['TRIS' or 'LINES', positions, colors], ['TEXT', texts] or ['CUSTOM', function, args]
+
+    def clear(self):
+        self.runs.clear()
+
+    def get_run(self, kind):
+        #Returns the last run if it is of the given kind, so consecutive shapes of one kind share a batch
+        if self.runs and self.runs[-1][0] == kind:
+            return self.runs[-1]
+        if kind == 'TEXT':
+            run = [kind, []]
+        else:
+            run = [kind, [], []]
+        self.runs.append(run)
+        return run
+
+    def add_line(self, sx, sy, ex, ey, color):
+        run = self.get_run('LINES')
+        run[1].extend(((sx, sy), (ex, ey)))
+        run[2].extend((color, color))
+
+    def add_tri(self, v1, v2, v3, color):
+        run = self.get_run('TRIS')
+        run[1].extend((v1, v2, v3))
+        run[2].extend((color, color, color))
+
+    def add_rect(self, x, y, w, h, color):
+        run = self.get_run('TRIS')
+        run[1].extend(((x, y), (x+w, y), (x, y+h), (x, y+h), (x+w, y), (x+w, y+h)))
+        run[2].extend((color, color, color, color, color, color))
+
+    def add_text(self, x, y, size, text, justify, color):
+        self.get_run('TEXT')[1].append((x, y, size, text, justify, color))
+
+    def add_custom(self, function, args):
+        self.runs.append(['CUSTOM', function, args])
+
+    def flush(self):
+        """Draws everything that has been added, then clears the list"""
+
+        for run in self.runs:
+            kind = run[0]
+            if kind == 'TEXT':
+                draw_texts(run[1])
+            elif kind == 'CUSTOM':
+                run[1](*run[2])
+            else:
+                gpu.state.blend_set("ALPHA")
+                shader = draw_registry.get_shader('SMOOTH_COLOR')
+                shader.bind()
+                batch = batch_for_shader(shader, kind, {'pos': run[1], 'color': run[2]})
+                batch.draw(shader)
+        self.clear()
+
+
+draw_lists = []
+
+
+def draw_begin():
+    """Starts collecting draw_line, draw_rect, draw_tri and draw_text calls into a DrawList instead of drawing them
+    immediately.  Must be matched by a call to draw_flush.
+    Returns: The DrawList that is being filled"""
+
+    draw_list = DrawList()
+    draw_lists.append(draw_list)
+    return draw_list
+
+
+def draw_flush():
+    """Draws and removes the DrawList started by the last draw_begin call"""
+
+    if draw_lists:
+        draw_lists.pop().flush()
+
+
+def draw_batched(function):
+    """Decorator for draw handlers, collects everything the handler draws and flushes it in one go when it returns"""
+
+    @functools.wraps(function)
+    def batched_function(*args, **kwargs):
+        draw_begin()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            draw_flush()
+    return batched_function
+
+
+class DrawRegistry(object):
+    """Shaders and unit shape batches shared by all VSEQF drawing.  They are created the first time they are needed,
+    and released by clear when the addon is unregistered.
+    The unit shapes are drawn at any size and position by setting a transform matrix, so drawing a single shape does not
+    need a new batch."""
+
+    unit_shapes = {
+        'QUAD': ('TRIS', ((0, 0), (1, 0), (0, 1), (1, 1)), ((0, 1, 2), (2, 1, 3))),
+        'TRI': ('TRIS', ((0, 0), (1, 0), (0, 1)), ((0, 1, 2), )),
+        'LINE': ('LINES', ((0, 0), (1, 1)), None)
+    }
+
+    def __init__(self):
+        self.shaders = {}
+        self.batches = {}
+
+    def get_shader(self, name):
+        shader = self.shaders.get(name)
+        if shader is None:
+            shader = gpu.shader.from_builtin(name)
+            self.shaders[name] = shader
+        return shader
+
+    def get_unit_batch(self, name):
+        batch = self.batches.get(name)
+        if batch is None:
+            batch_type, vertices, indices = self.unit_shapes[name]
+            batch = batch_for_shader(self.get_shader('UNIFORM_COLOR'), batch_type, {"pos": vertices}, indices=indices)
+            self.batches[name] = batch
+        return batch
+
+    def draw_unit(self, name, matrix, color):
+        """Draws one of the unit shapes
+        Arguments:
+            name: String, the unit shape to draw: 'QUAD', 'TRI' or 'LINE'
+            matrix: Matrix that transforms the unit shape to its place in the region
+            color: List of red, green, blue, alpha"""
+
+        gpu.state.blend_set("ALPHA")
+        shader = self.get_shader('UNIFORM_COLOR')
+        batch = self.get_unit_batch(name)
+        with gpu.matrix.push_pop():
+            gpu.matrix.multiply_matrix(matrix)
+            shader.bind()
+            shader.uniform_float('color', color)
+            batch.draw(shader)
+
+    def clear(self):
+        self.shaders = {}
+        self.batches = {}
+
+
+draw_registry = DrawRegistry()
+
+
+def shape_matrix(origin, x_axis, y_axis):
+    #Returns a matrix that moves the unit shape corner (0, 0) to origin, (1, 0) to origin+x_axis and (0, 1) to origin+y_axis
+    return Matrix((
+        (x_axis[0], y_axis[0], 0, origin[0]),
+        (x_axis[1], y_axis[1], 0, origin[1]),
+        (0, 0, 1, 0),
+        (0, 0, 0, 1)
+    ))
+
+
 def draw_line(sx, sy, ex, ey, color=(1.0, 1.0, 1.0, 1.0)):
-    gpu.state.blend_set("ALPHA")
-    coords = [(sx, sy), (ex, ey)]
-    shader = gpu.shader.from_builtin('UNIFORM_COLOR')
-    batch = batch_for_shader(shader, 'LINES', {'pos': coords})
-    shader.bind()
-    shader.uniform_float('color', color)
-    batch.draw(shader)
+    if draw_lists:
+        draw_lists[-1].add_line(sx, sy, ex, ey, color)
+        return
+    draw_registry.draw_unit('LINE', shape_matrix((sx, sy), (ex - sx, 0), (0, ey - sy)), color)
 
 
 def draw_rect(x, y, w, h, color=(1.0, 1.0, 1.0, 1.0)):
-    gpu.state.blend_set("ALPHA")
-    vertices = ((x, y), (x+w, y), (x, y+h), (x+w, y+h))
-    indices = ((0, 1, 2), (2, 1, 3))
-    shader = gpu.shader.from_builtin('UNIFORM_COLOR')
-    batch = batch_for_shader(shader, 'TRIS', {"pos": vertices}, indices=indices)
-    shader.bind()
-    shader.uniform_float('color', color)
-    batch.draw(shader)
+    if draw_lists:
+        draw_lists[-1].add_rect(x, y, w, h, color)
+        return
+    draw_registry.draw_unit('QUAD', shape_matrix((x, y), (w, 0), (0, h)), color)
 
 
 def draw_tri(v1, v2, v3, color=(1.0, 1.0, 1.0, 1.0)):
-    gpu.state.blend_set("ALPHA")
-    vertices = (v1, v2, v3)
-    indices = ((0, 1, 2), )
-    shader = gpu.shader.from_builtin('UNIFORM_COLOR')
-    batch = batch_for_shader(shader, 'TRIS', {"pos": vertices}, indices=indices)
-    shader.bind()
-    shader.uniform_float('color', color)
-    batch.draw(shader)
+    if draw_lists:
+        draw_lists[-1].add_tri(v1, v2, v3, color)
+        return
+    draw_registry.draw_unit('TRI', shape_matrix(v1, (v2[0] - v1[0], v2[1] - v1[1]), (v3[0] - v1[0], v3[1] - v1[1])), color)
+
+
+def draw_custom(function, *args):
+    #Calls a function that draws with its own batches, or queues it in order with the other shapes if a DrawList is
+    #being filled
+    if draw_lists:
+        draw_lists[-1].add_custom(function, args)
+        return
+    function(*args)
 
 
 def draw_text(x, y, size, text, justify='left', color=(1.0, 1.0, 1.0, 1.0)):
-    #Draws basic text at a given location
+    #Draws basic text at a given location, or queues it if a DrawList is being filled
+    if draw_lists:
+        draw_lists[-1].add_text(x, y, size, text, justify, color)
+        return
+    draw_text_immediate(x, y, size, text, justify, color)
+
+
+def draw_text_immediate(x, y, size, text, justify='left', color=(1.0, 1.0, 1.0, 1.0)):
+    draw_texts(((x, y, size, text, justify, color), ))
+
+
+def draw_texts(texts):
+    """Draws a list of text, only changing the font size and color when they differ from the previous text
+    Arguments:
+        texts: List of text data, each is a list of: x, y, size, text, justify, color"""
+
     gpu.state.blend_set("ALPHA")
     font_id = 0
-    blf.color(font_id, *color)
-    if justify == 'right':
-        text_width, text_height = blf.dimensions(font_id, text)
-    else:
-        text_width = 0
-    blf.position(font_id, x - text_width, y, 0)
+    last_size = None
+    last_color = None
+    for x, y, size, text, justify, color in texts:
+        if size != last_size:
+            blf.size(font_id, size)
+            last_size = size
+        if color != last_color:
+            blf.color(font_id, *color)
+            last_color = color
+        if justify == 'right':
+            text_width = text_dimensions(text, size)[0]
+        else:
+            text_width = 0
+        blf.position(font_id, x - text_width, y, 0)
+        blf.draw(font_id, text)
+
+
+@functools.lru_cache(maxsize=1024)
+def text_dimensions(text, size):
+    """Measures text in the default font, results are cached since overlays draw the same text every redraw
+    Arguments:
+        text: String to measure
+        size: Font size to measure at
+
+    Returns: List of width, height"""
+
+    font_id = 0
     blf.size(font_id, size)
-    blf.draw(font_id, text)
+    return blf.dimensions(font_id, text)
 
 
 #Miscellaneous Functions
@@ -107,10 +309,119 @@ def get_prefs():
     return prefs
 
 
+class AppTimer(object):
+    """A bpy.app.timers callback that can be started, restarted and stopped.  Blender matches timers by identity, so the
+    function is stored once and the same object is used for registering and unregistering.  Timers are registered as
+    persistent, so they are not dropped when a file is loaded."""
+
+    def __init__(self, function):
+        self.function = function
+
+    def is_running(self):
+        return bpy.app.timers.is_registered(self.function)
+
+    def start(self, first_interval=0):
+        """Runs the function after first_interval seconds, replacing the timer if it is already running"""
+        self.stop()
+        bpy.app.timers.register(self.function, first_interval=first_interval, persistent=True)
+
+    def stop(self):
+        if self.is_running():
+            bpy.app.timers.unregister(self.function)
+
+
+class RedrawScheduler(object):
+    """Collects requests to redraw areas and redraws them all at once from a timer on the next event loop, so several
+    requests made while handling one event only cause one redraw of each area.
+    Requests can be limited to a number of redraws per second, requests that come in too soon are delayed."""
+
+    def __init__(self):
+        self.area_types = set()
+        self.area_pointers = set()
+        self.limit_keys = set()
+        self.last_redraws = {}  #limit key: time of last redraw
+        self.due = None
+        self.timer = AppTimer(self.flush)
+
+    def tag(self, area_types=(), area=None, limit_key=None, max_fps=0):
+        """Requests a redraw
+        Arguments:
+            area_types: List of area type strings, all areas of these types in all windows will be redrawn
+            area: A single Area to redraw
+            limit_key: String, requests with the same key share the max_fps limit
+            max_fps: Maximum redraws per second for requests with this limit_key, 0 for no limit"""
+
+        now = time.perf_counter()
+        delay = 0
+        if limit_key is not None:
+            if max_fps:
+                since_last = now - self.last_redraws.get(limit_key, 0)
+                interval = 1 / max_fps
+                if since_last < interval:
+                    delay = interval - since_last
+            self.limit_keys.add(limit_key)
+        self.area_types.update(area_types)
+        if area is not None:
+            self.area_pointers.add(area.as_pointer())
+        self.schedule(now + delay)
+
+    def schedule(self, due):
+        if self.due is not None and due >= self.due and self.timer.is_running():
+            return
+        self.due = due
+        self.timer.start(first_interval=max(due - time.perf_counter(), 0))
+
+    def flush(self):
+        """Timer callback, redraws all requested areas"""
+
+        area_types = self.area_types
+        area_pointers = self.area_pointers
+        now = time.perf_counter()
+        for limit_key in self.limit_keys:
+            self.last_redraws[limit_key] = now
+        self.area_types = set()
+        self.area_pointers = set()
+        self.limit_keys = set()
+        self.due = None
+        window_manager = bpy.context.window_manager
+        if window_manager is None:
+            return None
+        for window in window_manager.windows:
+            screen = window.screen
+            if screen is None:
+                continue
+            for area in screen.areas:
+                if area.type in area_types or (area_pointers and area.as_pointer() in area_pointers):
+                    area.tag_redraw()
+        return None
+
+    def cancel(self):
+        """Forgets all requests and removes the timer, call when unregistering the addon or loading a file"""
+
+        self.timer.stop()
+        self.area_types = set()
+        self.area_pointers = set()
+        self.limit_keys = set()
+        self.due = None
+
+
+redraw_scheduler = RedrawScheduler()
+
+
+def redraw_areas(area_types, limit_key=None, max_fps=0):
+    """Redraws all areas of the given types in all windows on the next event loop, see RedrawScheduler.tag"""
+
+    redraw_scheduler.tag(area_types=area_types, limit_key=limit_key, max_fps=max_fps)
+
+
+def redraw_area(area):
+    """Redraws one area on the next event loop"""
+
+    redraw_scheduler.tag(area=area)
+
+
 def redraw_sequencers():
-    for area in bpy.context.screen.areas:
-        if area.type == 'SEQUENCE_EDITOR':
-            area.tag_redraw()
+    redraw_areas(['SEQUENCE_EDITOR'])
 
 
 def get_fps(scene=None):
@@ -137,6 +448,20 @@ def timecode_from_frames(frame, fps, levels=0, subsecond_type='miliseconds', mod
 
     Returns: A string timecode"""
 
+    if mode != 'string':
+        return calculate_timecode(frame, fps, levels, subsecond_type, mode)
+    return cached_timecode(frame, fps, levels, subsecond_type)
+
+
+@functools.lru_cache(maxsize=1024)
+def cached_timecode(frame, fps, levels, subsecond_type):
+    #Overlays format the same lengths every redraw, so string timecodes are cached
+    return calculate_timecode(frame, fps, levels, subsecond_type, 'string')
+
+
+def calculate_timecode(frame, fps, levels, subsecond_type, mode):
+    #Does the work for timecode_from_frames
+
     #ensure the levels value is sane
     if levels > 4:
         levels = 4
@@ -1,22 +1,34 @@
 import bpy
+import gpu
 import math
+import numpy
+from gpu_extras.batch import batch_for_shader
 from . import vseqf
+from . import profiling
 from . import fades
 from . import timeline
+from . import envelopes
 
 vu_max_delay = 0
 vu_meter_min = -60
 vu_meter_sweet_spot = 0.7
+vu_meter_marks = [
+    [1,     '____    '],
+    [.9,    '____ -6 '],
+    [.7,    '____ -18'],
+    [.3333, '____ -40'],
+    [0,     '____ -60']
+]
 
 
-def display_report(report):
+def display_report(report, name='Clipping Report'):
     text_document = None
     for text in bpy.data.texts:
-        if text.name == 'Clipping Report':
+        if text.name == name:
             text_document = text
             break
     if text_document is None:
-        text_document = bpy.data.texts.new('Clipping Report')
+        text_document = bpy.data.texts.new(name)
     text_document.clear()
     text_document.from_string(report)
 
@@ -36,26 +48,11 @@ def get_volume_unit(frame=None):
     fps = vseqf.get_fps()
     for strip in strips:
         if strip.type == 'SOUND' and timeline.under_cursor(strip, frame) and not timeline.is_muted(sequence_editor, strip):
-            time_from = (frame - 1 - strip.content_start) / fps
-            time_to = (frame + 1 - strip.content_start) / fps
-            audio = strip.sound.evaluated_get(depsgraph).factory
-            chunk = audio.limit(time_from, time_to).data()
-            if len(chunk) == 0:
-                #sometimes the chunks cannot be read properly, try to read 2 frames instead
-                time_from_temp = (frame - 2 - strip.content_start) / fps
-                chunk = audio.limit(time_from_temp, time_to).data()
-            if len(chunk) == 0:
-                #chunk still couldn't be read... just give up :\
-                average = 0
-            else:
-                max = abs(chunk.max())
-                min = abs(chunk.min())
-                if max > min:
-                    average = max
-                else:
-                    average = min
+            average = envelopes.strip_peak(strip, frame, fps, depsgraph=depsgraph, background=True)
+            if average is None:
+                average = decode_peak(strip, frame, fps, depsgraph)
             if evaluate_volume:
-                fcurve = fades.get_fade_curve(bpy.context, strip, create=False)
+                fcurve = fades.fade_cache.get_fade_curve(bpy.context, strip)
                 if fcurve:
                     volume = fcurve.evaluate(frame)
                 else:
@@ -66,6 +63,29 @@ def get_volume_unit(frame=None):
     return total
 
 
+def decode_peak(strip, frame, fps, depsgraph):
+    #Decodes the audio of a sound strip around a frame and returns the highest level found
+    time_from = (frame - 1 - strip.content_start) / fps
+    time_to = (frame + 1 - strip.content_start) / fps
+    audio = strip.sound.evaluated_get(depsgraph).factory
+    chunk = audio.limit(time_from, time_to).data()
+    if len(chunk) == 0:
+        #sometimes the chunks cannot be read properly, try to read 2 frames instead
+        time_from_temp = (frame - 2 - strip.content_start) / fps
+        chunk = audio.limit(time_from_temp, time_to).data()
+    if len(chunk) == 0:
+        #chunk still couldn't be read... just give up :\
+        average = 0
+    else:
+        max = abs(chunk.max())
+        min = abs(chunk.min())
+        if max > min:
+            average = max
+        else:
+            average = min
+    return average
+
+
 def vu_meter_calculate(scene):
     if scene != bpy.context.scene:
         return
@@ -91,8 +111,7 @@ def vu_meter_calculate(scene):
             vu_max_delay = 0
 
         # make sure sequence editor is refreshed on blender 3.x
-        for area in sequencers:
-            area.tag_redraw()
+        vseqf.redraw_areas(['SEQUENCE_EDITOR'], limit_key='vu_meter', max_fps=vseqf.get_prefs().vu_max_fps)
 
 
 def percent_to_db(percent):
@@ -113,6 +132,69 @@ def vu_formatted(db):
     return db_text.rjust(8)
 
 
+class VUMeterBackground(object):
+    """Cached batch and labels for the parts of the VU meter that only change when the region is resized or the meter
+    is moved to the other side, so each redraw only needs to draw the meter bars"""
+
+    def __init__(self, key, offset_x, scrollbar, max_height, bottom_section, meter_height):
+        bg_color = (0, 0, 0, 1)
+        label_color = (.5, .5, .5, 1)
+        self.key = key
+        self.shader = vseqf.draw_registry.get_shader('UNIFORM_COLOR')
+        self.color = bg_color
+        x = offset_x
+        y = scrollbar
+        w = 45
+        h = max_height - scrollbar
+        vertices = ((x, y), (x+w, y), (x, y+h), (x+w, y+h))
+        indices = ((0, 1, 2), (2, 1, 3))
+        self.batch = batch_for_shader(self.shader, 'TRIS', {"pos": vertices}, indices=indices)
+        self.labels = []
+        for mark in vu_meter_marks:
+            height = 1 + bottom_section + (mark[0] * meter_height)
+            self.labels.append((offset_x, height, 10, mark[1], 'left', label_color))
+
+    def draw_background(self):
+        gpu.state.blend_set("ALPHA")
+        self.shader.bind()
+        self.shader.uniform_float('color', self.color)
+        self.batch.draw(self.shader)
+
+    def draw(self):
+        vseqf.draw_custom(self.draw_background)
+        for label in self.labels:
+            vseqf.draw_text(*label)
+
+
+vu_meter_backgrounds = {}  #(region width, region height, vu_left): VUMeterBackground
+
+
+def get_vu_meter_background(region, vu_left, offset_x, scrollbar, max_height, bottom_section, meter_height):
+    """Returns the cached VU meter background for a region size, creating it if needed
+    Returns: VUMeterBackground"""
+
+    key = (region.width, region.height, vu_left)
+    background = vu_meter_backgrounds.get(key)
+    if background is None:
+        if len(vu_meter_backgrounds) > 8:
+            #regions have been resized a lot, forget the old sizes
+            vu_meter_backgrounds.clear()
+        background = VUMeterBackground(key, offset_x, scrollbar, max_height, bottom_section, meter_height)
+        vu_meter_backgrounds[key] = background
+    return background
+
+
+def clear_vu_meter_backgrounds():
+    vu_meter_backgrounds.clear()
+
+
+def draw_meter_bar(x, y, w, h, color):
+    #Level bars change every redraw, so they are drawn as the shared unit quad moved into place instead of a new batch
+    vseqf.draw_custom(vseqf.draw_registry.draw_unit, 'QUAD', vseqf.shape_matrix((x, y), (w, 0), (0, h)), color)
+
+
+@profiling.profiled
+@vseqf.draw_batched
 def vu_meter_draw():
     context = bpy.context
     vseqf_settings = context.scene.vseqf
@@ -125,7 +207,6 @@ def vu_meter_draw():
         warn_color = [1, .0, .0, 1]
         very_high_color = [1, .6, .6, 1]
         high_color = [1, 1, .5, 1]
-        bg_color = [0, 0, 0, 1]
         region = context.region
         max_height = region.height - top_section
         meter_height = max_height - bottom_section
@@ -135,17 +216,8 @@ def vu_meter_draw():
             offset_x = 0
 
         #Draw Background
-        vseqf.draw_rect(offset_x, scrollbar, 45, max_height - scrollbar, bg_color)
-        marks = [
-            [1,     '____    '], 
-            [.9,    '____ -6 '], 
-            [.7,    '____ -18'], 
-            [.3333, '____ -40'], 
-            [0,     '____ -60']
-        ]
-        for mark in marks:
-            height = 1 + bottom_section + (mark[0] * meter_height)
-            vseqf.draw_text(offset_x, height, 10, mark[1], color=(.5, .5, .5, 1))
+        background = get_vu_meter_background(region, vseqf_settings.vu_left, offset_x, scrollbar, max_height, bottom_section, meter_height)
+        background.draw()
         vu = vseqf_settings.vu
         if vu > 0:
             vu = 0
@@ -156,15 +228,15 @@ def vu_meter_draw():
         vu_size = meter_height * vu_percent
 
         #Draw meter
-        vseqf.draw_rect(offset_x + 2, bottom_section, 15, vu_size, vu_color)
+        draw_meter_bar(offset_x + 2, bottom_section, 15, vu_size, vu_color)
         if 0 >= vseqf_settings.vu > -18:
             high_start = 0.7 * meter_height
             high_size = vu_size - high_start
-            vseqf.draw_rect(offset_x + 2, bottom_section + high_start, 15, high_size, high_color)
+            draw_meter_bar(offset_x + 2, bottom_section + high_start, 15, high_size, high_color)
             if vseqf_settings.vu > -6:
                 warn_start = 0.9 * meter_height
                 warn_size = vu_size - warn_start
-                vseqf.draw_rect(offset_x + 2, bottom_section + warn_start, 15, warn_size, very_high_color)
+                draw_meter_bar(offset_x + 2, bottom_section + warn_start, 15, warn_size, very_high_color)
 
         vseqf.draw_text(offset_x, 20, 10, vu_formatted(vseqf_settings.vu), color=vu_color)
 
@@ -180,18 +252,134 @@ def vu_meter_draw():
             vu_max_color = text_color
         vu_max_percent = ((vu_max + -vu_meter_min)/-vu_meter_min)
         vu_max_pos = meter_height * vu_max_percent
-        vseqf.draw_rect(offset_x + 2, bottom_section + vu_max_pos - 2, 15, 2, vu_max_color)
+        draw_meter_bar(offset_x + 2, bottom_section + vu_max_pos - 2, 15, 2, vu_max_color)
+
+
+def curve_values(fcurve, frames):
+    """Evaluates an fcurve on an array of frames.  When the curve has constant extrapolation and no modifiers, the
+    keyframes are read in bulk and linear and constant segments are calculated in one pass, only frames in other
+    segments are evaluated one at a time.
+    Arguments:
+        fcurve: FCurve to evaluate
+        frames: numpy array of frames
+
+    Returns: numpy array of values"""
+
+    keyframes = fcurve.keyframe_points
+    count = len(keyframes)
+    if count == 0 or fcurve.extrapolation != 'CONSTANT' or len(fcurve.modifiers) > 0:
+        return numpy.array([fcurve.evaluate(frame) for frame in frames], dtype=numpy.float32)
+    coordinates = numpy.empty(count * 2, dtype=numpy.float32)
+    keyframes.foreach_get('co', coordinates)
+    key_frames = coordinates[0::2]
+    key_values = coordinates[1::2]
+    values = numpy.interp(frames, key_frames, key_values).astype(numpy.float32)
+    #segment each frame is in, the keyframe at the start of the segment decides how it is interpolated
+    segments = numpy.searchsorted(key_frames, frames, side='right') - 1
+    for segment, keyframe in enumerate(keyframes[:-1]):
+        interpolation = keyframe.interpolation
+        if interpolation == 'LINEAR':
+            continue
+        in_segment = numpy.flatnonzero(segments == segment)
+        if interpolation == 'CONSTANT':
+            values[in_segment] = key_values[segment]
+        else:
+            for index in in_segment:
+                values[index] = fcurve.evaluate(frames[index])
+    return values
+
+
+def range_sounds(context, start, end):
+    """Finds the unmuted sound strips that overlap a frame range
+    Returns: List of Strips"""
+
+    sequence_editor = context.scene.sequence_editor
+    if sequence_editor is None:
+        return []
+    sounds = []
+    for strip in sequence_editor.strips_all:
+        if strip.type == 'SOUND' and strip.right_handle > start and strip.left_handle < end and not timeline.is_muted(sequence_editor, strip):
+            sounds.append(strip)
+    return sounds
+
+
+def mixed_levels(context, start, end, build=True, progress=None, unmeasured=None):
+    """Finds the peak level of the mix of all unmuted sound strips on every frame in a range, the same as calling
+    get_volume_unit on each frame, but reading every strip in one pass using sound envelopes
+    Arguments:
+        context: Blender context
+        start: Integer, first frame to check
+        end: Integer, last frame to check
+        build: Boolean, if False, strips without an envelope ready are left out instead of building one
+        progress: Optional function, called with the portion of strips done, from 0 to 1
+        unmeasured: Optional list, strips that were left out because their sound has not been measured are added to it
+
+    Returns: List of a numpy array of frames, numpy array of levels"""
+
+    frames = numpy.arange(start, end + 1)
+    levels = numpy.zeros(len(frames), dtype=numpy.float32)
+    depsgraph = context.evaluated_depsgraph_get()
+    fps = vseqf.get_fps(context.scene)
+    sounds = range_sounds(context, start, end)
+    for index, strip in enumerate(sounds):
+        #frames where the strip is under the cursor, matching timeline.under_cursor()
+        inside = (frames > strip.left_handle) & (frames < strip.right_handle)
+        strip_frames = frames[inside]
+        if len(strip_frames) > 0:
+            envelope = envelopes.get_envelope(strip.sound, fps, depsgraph=depsgraph, build=build)
+            if envelope is None:
+                if unmeasured is not None:
+                    unmeasured.append(strip)
+                continue
+            peaks = envelope.peaks_at(strip_frames - strip.content_start)
+            fcurve = fades.fade_cache.get_fade_curve(context, strip)
+            if fcurve:
+                volumes = curve_values(fcurve, strip_frames)
+            else:
+                volumes = strip.volume
+            levels[inside] += peaks * volumes
+        if progress is not None:
+            progress((index + 1) / len(sounds))
+    return [frames, levels]
+
+
+def clipping_report(clipping, unmeasured=()):
+    """Formats a list of clipped frames for display_report
+    Arguments:
+        clipping: List of frame, volume pairs
+        unmeasured: List of strips that could not be checked
+
+    Returns: String"""
+
+    if len(clipping) > 0:
+        clipped_report = 'Found '+str(len(clipping))+' frames with audio clipping:\n\n'
+        lines = []
+        for clipped in clipping:
+            lines.append('Frame '+str(clipped[0])+' clipping at volume '+str(clipped[1])+'\n')
+        clipped_report = clipped_report+''.join(lines)
+    else:
+        clipped_report = 'No clipping found'
+    if unmeasured:
+        lines = ['\n\nThe audio of '+str(len(unmeasured))+' strips could not be measured, they were not checked:\n\n']
+        for strip in unmeasured:
+            lines.append(strip.name+'\n')
+        clipped_report = clipped_report+''.join(lines)
+    return clipped_report
 
 
 class VUMeterCheckClipping(bpy.types.Operator):
     bl_idname = 'vseqf.check_clipping'
     bl_label = 'Check For Audio Clipping'
 
+    mode: bpy.props.EnumProperty(name='Mode', default='RANGE', items=[("RANGE", "Whole Range", "Measure the whole scene range at once using the audio levels of each sound, sounds not measured yet are measured in the background first", 1), ("FRAME", "Frame By Frame", "Decode and measure the audio of one frame at a time", 2)])
+
     start = 0
     end = 0
     current = 0
     percentage = 0
     clipping = []
+    waiting = []
+    unmeasured = []
 
     def execute(self, context):
         self.percentage = 0
@@ -199,16 +387,44 @@ class VUMeterCheckClipping(bpy.types.Operator):
         self.start = scene.frame_start
         self.end = scene.frame_end
         self.current = self.start
+        self.clipping = []
+        if self.mode == 'RANGE':
+            #sounds without envelopes are measured by envelope_builder in the background, the check runs once they are done
+            fps = vseqf.get_fps(scene)
+            depsgraph = context.evaluated_depsgraph_get()
+            self.waiting = []
+            for strip in range_sounds(context, self.start, self.end):
+                if envelopes.get_envelope(strip.sound, fps, depsgraph=depsgraph, background=True, length=strip.content_duration / fps) is None:
+                    self.waiting.append(envelopes.envelope_key(strip.sound, fps))
+            self._timer = context.window_manager.event_timer_add(time_step=0.1, window=context.window)
+            context.window_manager.modal_handler_add(self)
+            return {'RUNNING_MODAL'}
         self._timer = context.window_manager.event_timer_add(time_step=0.00001, window=context.window)
         context.window_manager.modal_handler_add(self)
         context.window_manager.progress_begin(0, 100)
-        self.clipping = []
         return {'RUNNING_MODAL'}
 
+    def check_range(self, context):
+        self.unmeasured = []
+        frames, levels = mixed_levels(context, self.start, self.end, build=False, unmeasured=self.unmeasured)
+        clipped = numpy.flatnonzero(levels > 1)
+        self.clipping = [[int(frames[index]), float(levels[index])] for index in clipped]
+
     def modal(self, context, event):
         if event.type in {'RIGHTMOUSE', 'ESC'}:
             self.end_modal(context)
             return {'CANCELLED'}
+        if self.mode == 'RANGE':
+            if event.type != 'TIMER':
+                return {'PASS_THROUGH'}
+            for key in self.waiting:
+                if envelopes.envelope_builder.is_building(key):
+                    return {'RUNNING_MODAL'}
+            self.end_modal(context)
+            self.check_range(context)
+            self.report({'INFO'}, "Clipping report saved, check 'Clipping Report' in the text editor")
+            display_report(clipping_report(self.clipping, self.unmeasured))
+            return {'FINISHED'}
         volume = get_volume_unit(self.current)
         self.percentage = (self.current - self.start) / (self.end - self.start)
         context.window_manager.progress_update(self.percentage)
@@ -217,17 +433,13 @@ class VUMeterCheckClipping(bpy.types.Operator):
         self.current = self.current + 1
         if self.current > self.end:
             self.end_modal(context)
-            if len(self.clipping) > 0:
-                clipped_report = 'Found '+str(len(self.clipping))+' frames with audio clipping:\n\n'
-                for clipped in self.clipping:
-                    clipped_report = clipped_report+'Frame '+str(clipped[0])+' clipping at volume '+str(clipped[1])+'\n'
-            else:
-                clipped_report = 'No clipping found'
             self.report({'INFO'}, "Clipping report saved, check 'Clipping Report' in the text editor")
-            display_report(clipped_report)
+            display_report(clipping_report(self.clipping))
             return {'FINISHED'}
         return {'RUNNING_MODAL'}
 
     def end_modal(self, context):
-        context.window_manager.progress_end()
+        if self.mode != 'RANGE':
+            #envelope_builder shows its own progress while the range check is waiting
+            context.window_manager.progress_end()
         context.window_manager.event_timer_remove(self._timer)